@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+
+# Time to parse a big generated page and run a CSS filter on it, html.parser+soupsieve against lxml+cssselect
+# Run from the repository root:
+#   python3 bench/css_filter.py -r 2 -s 2.9
+
+import getopt
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from changedetectionio import html_tools
+
+
+# About 'size_mb' of product listing, with one #total at the end
+def generate_page(size_mb):
+    row = '<div class="product"><h2>Product {i}</h2><p class="description">Some text about product {i}</p>' \
+          '<span class="price">{i}.99</span><a href="/product/{i}">More</a></div>\n'
+    rows = []
+    size = 0
+    i = 0
+    while size < size_mb * 1024 * 1024:
+        rows.append(row.format(i=i))
+        size += len(rows[-1])
+        i += 1
+
+    return "<html><head><title>Products</title></head><body>\n{}<div id=\"total\">{} products</div></body></html>".format(
+        "".join(rows), i)
+
+
+def main():
+    runs = 2
+    size_mb = 2.9
+
+    opts, args = getopt.getopt(sys.argv[1:], "r:s:", ["runs=", "size="])
+    for opt, arg in opts:
+        if opt in ("-r", "--runs"):
+            runs = int(arg)
+        if opt in ("-s", "--size"):
+            size_mb = float(arg)
+
+    content = generate_page(size_mb)
+    print("Page of {:.1f} MB, average of {} runs, parse + select".format(len(content) / 1024 / 1024, runs))
+
+    for parser, name in [('html.parser', "html.parser+soupsieve"), ('lxml', "lxml+cssselect")]:
+        if parser == 'lxml' and not html_tools.has_lxml:
+            print("  {:<22} lxml is not installed".format(name))
+            continue
+
+        timings = []
+        for rule in ["#total", ".price"]:
+            total = 0
+            for _ in range(runs):
+                now = time.perf_counter()
+                html_tools.css_filter(rule, soup=html_tools.parse_html(content, parser))
+                total += time.perf_counter() - now
+            timings.append("{} {:.2f}s".format(rule, total / runs))
+
+        print("  {:<22} {}".format(name, "  ".join(timings)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+
+# Checks per second of the update_worker threads, against a local HTTP server so the network isn't what's measured
+# Run from the repository root, on two commits to compare them:
+#   python3 bench/update_worker.py -c 200 -w 1
+
+import getopt
+import http.server
+import logging
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from changedetectionio import store
+from changedetectionio.update_worker import update_worker
+from changedetectionio.work_queue import UniqueWorkQueue
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # http.server sends the headers and the body separately, with Nagle that waits for the
+    # delayed ACK of the headers (~40ms) on every request of a kept-alive connection
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = "<html><body><p>Some text for {}</p></body></html>".format(self.path).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    checks = 200
+    workers = 1
+
+    opts, args = getopt.getopt(sys.argv[1:], "c:w:", ["checks=", "workers="])
+    for opt, arg in opts:
+        if opt in ("-c", "--checks"):
+            checks = int(arg)
+        if opt in ("-w", "--workers"):
+            workers = int(arg)
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    datastore = store.ChangeDetectionStore(datastore_path=tempfile.mkdtemp(), include_default_watches=False)
+    uuids = [datastore.add_watch(url="http://127.0.0.1:{}/page-{}".format(server.server_port, i), tag="")
+             for i in range(checks)]
+
+    # Just what update_worker uses from the Flask app
+    app = SimpleNamespace(config=SimpleNamespace(exit=threading.Event()), logger=logging.getLogger("bench"))
+    q = UniqueWorkQueue()
+    threads = [update_worker(q, queue.Queue(), app, datastore, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    now = time.time()
+    for uuid in uuids:
+        q.put(uuid)
+
+    while any(not datastore.data['watching'][uuid]['last_checked'] for uuid in uuids):
+        time.sleep(0.01)
+    elapsed = time.time() - now
+
+    errors = sum(1 for uuid in uuids if datastore.data['watching'][uuid]['last_error'])
+    print("{} checks in {:.2f}s with {} worker(s), {:.2f} checks/sec, {} errors".format(
+        checks, elapsed, workers, checks / elapsed, errors))
+
+    app.config.exit.set()
+    datastore.stop_thread = True
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,18 @@ import changedetectionio
 
 from changedetectionio import store
 
+def worker_main(coordinator_url):
+    from changedetectionio import remote_worker
+
+    # Same token as the WORKER_TOKEN env var of the coordinator
+    token = os.getenv('WORKER_TOKEN')
+    if not token:
+        print("ERROR: Set the WORKER_TOKEN env var to the same value as on the coordinator.", file=sys.stderr)
+        sys.exit(2)
+
+    remote_worker.run_workers(coordinator_url, token, int(os.getenv('WORKER_THREADS', 4)))
+
+
 def main():
     ssl_mode = False
     port = os.environ.get('PORT') or 5000
@@ -21,9 +33,9 @@ def main():
     datastore_path = os.path.join(os.getcwd(), "datastore")
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "Ccsd:p:", "port")
+        opts, args = getopt.getopt(sys.argv[1:], "Ccsd:p:", ["port", "worker="])
     except getopt.GetoptError:
-        print('backend.py -s SSL enable -p [port] -d [datastore path]')
+        print('backend.py -s SSL enable -p [port] -d [datastore path] --worker [coordinator URL]')
         sys.exit(2)
 
     create_datastore_dir = False
@@ -51,6 +63,11 @@ def main():
         if opt == '-C':
             create_datastore_dir = True
 
+        # Only run workers that get their jobs from another changedetection.io instance, no datastore needed
+        if opt == '--worker':
+            worker_main(arg)
+            return
+
     # isnt there some @thingy to attach to each route to tell it, that this route needs a datastore
     app_config = {'datastore_path': datastore_path}
 
@@ -22,6 +22,9 @@ from threading import Event
 
 import queue
 
+from changedetectionio.work_queue import UniqueWorkQueue
+from changedetectionio.worker_pool import WorkerPool
+
 from flask import (
     Flask,
     render_template,
@@ -37,22 +40,30 @@ from feedgen.feed import FeedGenerator
 from flask import make_response
 import datetime
 import pytz
-from copy import deepcopy
 
 __version__ = "0.39.4"
 
 datastore = None
 
 # Local
-running_update_threads = []
 ticker_thread = None
+watch_scheduler = None
+worker_pool = None
 
 extra_stylesheets = []
 
-update_q = queue.Queue()
+update_q = UniqueWorkQueue()
 
 notification_q = queue.Queue()
 
+# UUIDs handed out to remote workers, and when, see /api/worker/next-job
+remote_jobs = {}
+# Seconds before a job that a remote worker never sent a result for is given up on
+remote_job_timeout = 300
+# The only watch fields a remote worker can set with its result, the snapshot itself is saved here from 'contents'
+remote_result_fields = ["previous_md5", "previous_raw_md5", "last_checked", "last_changed", "last_check_status",
+                        "last_error", "title", "etag", "last_modified", "encoding", "check_timings"]
+
 # Needs to be set this way because we also build and publish via pip
 base_path = os.path.dirname(os.path.realpath(__file__))
 app = Flask(
@@ -109,10 +120,9 @@ def populate_form_from_watch(form, watch):
 # running or something similar.
 @app.template_filter("format_last_checked_time")
 def _jinja2_filter_datetime(watch_obj, format="%Y-%m-%d %H:%M:%S"):
-    # Worker thread tells us which UUID it is currently processing.
-    for t in running_update_threads:
-        if t.current_uuid == watch_obj["uuid"]:
-            return "Checking now.."
+    # The queue knows which UUIDs a worker thread is currently processing.
+    if update_q.is_in_flight(watch_obj["uuid"]):
+        return "Checking now.."
 
     if watch_obj["last_checked"] == 0:
         return "Not yet"
@@ -183,8 +193,16 @@ class User(flask_login.UserMixin):
 
 def changedetection_app(config=None, datastore_o=None):
     global datastore
+    global watch_scheduler
+    global worker_pool
     datastore = datastore_o
 
+    from changedetectionio import scheduler
+
+    watch_scheduler = scheduler.WatchScheduler(datastore)
+    update_q.interactive_burst = datastore.data["settings"]["requests"]["interactive_burst"]
+    worker_pool = WorkerPool(update_q, notification_q, app, datastore, watch_scheduler)
+
     # app.config.update(config or {})
 
     login_manager = flask_login.LoginManager(app)
@@ -319,7 +337,8 @@ def changedetection_app(config=None, datastore_o=None):
         if pause_uuid:
             try:
                 datastore.data["watching"][pause_uuid]["paused"] ^= True
-                datastore.needs_write = True
+                datastore.mark_watch_dirty(pause_uuid)
+                watch_scheduler.schedule(pause_uuid)
 
                 return redirect(url_for("index", tag=limit_tag))
             except KeyError:
@@ -402,6 +421,9 @@ def changedetection_app(config=None, datastore_o=None):
                     else:
                         changes_removed += datastore.scrub_watch(uuid)
 
+                # last_checked was reset
+                watch_scheduler.schedule_all()
+
                 flash(
                     "Cleared snapshot history ({} snapshots removed)".format(
                         changes_removed
@@ -427,9 +449,7 @@ def changedetection_app(config=None, datastore_o=None):
 
         # 0 means that theres only one, so that there should be no 'unviewed' history availabe
         if newest_history_key == 0:
-            newest_history_key = list(
-                datastore.data["watching"][uuid]["history"].keys()
-            )[0]
+            newest_history_key = datastore.get_history_index(uuid).newest()
 
         if newest_history_key:
             with open(
@@ -489,6 +509,9 @@ def changedetection_app(config=None, datastore_o=None):
             update_obj = {
                 "url": form.url.data.strip(),
                 "minutes_between_check": form.minutes_between_check.data,
+                "max_body_size_mb": form.max_body_size_mb.data,
+                "webdriver_wait_for": form.webdriver_wait_for.data.strip(),
+                "webdriver_max_wait": form.webdriver_max_wait.data,
                 "tag": form.tag.data.strip(),
                 "title": form.title.data.strip(),
                 "headers": form.headers.data,
@@ -498,6 +521,12 @@ def changedetection_app(config=None, datastore_o=None):
                 "notification_body": form.notification_body.data,
                 "notification_format": form.notification_format.data,
                 "extract_title_as_title": form.extract_title_as_title.data,
+                # The filters etc could be different now, don't let a 304 skip processing the page again
+                "etag": None,
+                "last_modified": None,
+                "previous_raw_md5": "",
+                # Could be a different URL now
+                "encoding": None,
             }
 
             # Notification URLs
@@ -531,15 +560,17 @@ def changedetection_app(config=None, datastore_o=None):
                     ] = get_current_checksum_include_ignore_text(uuid=uuid)
 
             datastore.data["watching"][uuid].update(update_obj)
+            datastore.mark_watch_dirty(uuid)
+            watch_scheduler.schedule(uuid)
 
             flash("Updated watch.")
 
             # Re #286 - We wait for syncing new data to disk in another thread every 60 seconds
             # But in the case something is added we should save straight away
-            datastore.sync_to_json()
+            datastore.sync_to_disk(checkpoint=True)
 
             # Queue the watch for immediate recheck
-            update_q.put(uuid)
+            update_q.put(uuid, interactive=True)
 
             if form.trigger_check.data:
                 if len(form.notification_urls.data):
@@ -612,6 +643,12 @@ def changedetection_app(config=None, datastore_o=None):
             form.minutes_between_check.data = int(
                 datastore.data["settings"]["requests"]["minutes_between_check"]
             )
+            form.workers_min.data = datastore.data["settings"]["requests"]["workers_min"]
+            form.workers.data = datastore.data["settings"]["requests"]["workers"]
+            form.filter_processes.data = datastore.data["settings"]["requests"]["filter_processes"]
+            form.max_body_size_mb.data = datastore.data["settings"]["requests"]["max_body_size_mb"]
+            form.webdriver_max_wait.data = datastore.data["settings"]["requests"]["webdriver_max_wait"]
+            form.html_parser.data = datastore.data["settings"]["requests"]["html_parser"]
             form.notification_urls.data = datastore.data["settings"]["application"][
                 "notification_urls"
             ]
@@ -649,6 +686,21 @@ def changedetection_app(config=None, datastore_o=None):
             datastore.data["settings"]["requests"][
                 "minutes_between_check"
             ] = form.minutes_between_check.data
+            # Watches without their own time now have a different due time
+            watch_scheduler.schedule_all()
+            if form.workers.data is not None:
+                datastore.data["settings"]["requests"]["workers"] = form.workers.data
+            if form.workers_min.data:
+                datastore.data["settings"]["requests"]["workers_min"] = form.workers_min.data
+            if form.filter_processes.data is not None:
+                datastore.data["settings"]["requests"]["filter_processes"] = form.filter_processes.data
+            if form.max_body_size_mb.data is not None:
+                datastore.data["settings"]["requests"]["max_body_size_mb"] = form.max_body_size_mb.data
+            if form.webdriver_max_wait.data:
+                datastore.data["settings"]["requests"]["webdriver_max_wait"] = form.webdriver_max_wait.data
+            datastore.data["settings"]["requests"]["html_parser"] = form.html_parser.data
+            # Applies straight away, no restart needed
+            worker_pool.resize()
             datastore.data["settings"]["application"][
                 "extract_title_as_title"
             ] = form.extract_title_as_title.data
@@ -703,6 +755,7 @@ def changedetection_app(config=None, datastore_o=None):
             proxies_count=proxies_count,
             bad_proxies_count=bad_proxies_count,
             current_base_url=datastore.data["settings"]["application"]["base_url"],
+            worker_count=len(worker_pool),
         )
 
         return output
@@ -723,7 +776,7 @@ def changedetection_app(config=None, datastore_o=None):
                 if len(url) and validators.url(url):
                     new_uuid = datastore.add_watch(url=url.strip(), tag="")
                     # Straight into the queue.
-                    update_q.put(new_uuid)
+                    update_q.put(new_uuid, interactive=True)
                     good += 1
                 else:
                     if len(url):
@@ -768,23 +821,20 @@ def changedetection_app(config=None, datastore_o=None):
             flash("No history found for the specified link, bad link?", "error")
             return redirect(url_for("index"))
 
-        dates = list(watch["history"].keys())
-        # Convert to int, sort and back to str again
-        # @todo replace datastore getter that does this automatically
-        dates = [int(i) for i in dates]
-        dates.sort(reverse=True)
-        dates = [str(i) for i in dates]
+        history_index = datastore.get_history_index(uuid)
 
-        if len(dates) < 2:
+        if len(history_index) < 2:
             flash(
                 "Not enough saved change detection snapshots to produce a report.",
                 "error",
             )
             return redirect(url_for("index"))
 
+        newest_version = history_index.newest()
+
         # Save the current newest history as the most recently viewed
-        datastore.set_last_viewed(uuid, dates[0])
-        newest_file = watch["history"][dates[0]]
+        datastore.set_last_viewed(uuid, newest_version)
+        newest_file = watch["history"][newest_version]
         with open(newest_file, "r") as f:
             newest_version_file_contents = f.read()
 
@@ -793,7 +843,7 @@ def changedetection_app(config=None, datastore_o=None):
             previous_file = watch["history"][previous_version]
         except KeyError:
             # Not present, use a default value, the second one in the sorted list.
-            previous_file = watch["history"][dates[1]]
+            previous_file = watch["history"][history_index.previous()]
 
         with open(previous_file, "r") as f:
             previous_version_file_contents = f.read()
@@ -804,9 +854,9 @@ def changedetection_app(config=None, datastore_o=None):
             newest=newest_version_file_contents,
             previous=previous_version_file_contents,
             extra_stylesheets=extra_stylesheets,
-            versions=dates[1:],
+            versions=history_index.range(until=history_index.previous()),
             uuid=uuid,
-            newest_version_timestamp=dates[0],
+            newest_version_timestamp=newest_version,
             current_previous_version=str(previous_version),
             current_diff_url=watch["url"],
             extra_title=" - Diff - {}".format(
@@ -835,7 +885,11 @@ def changedetection_app(config=None, datastore_o=None):
             flash("No history found for the specified link, bad link?", "error")
             return redirect(url_for("index"))
 
-        newest = list(watch["history"].keys())[-1]
+        newest = datastore.get_history_index(uuid).newest()
+        if not newest:
+            flash("No history found for the specified link, bad link?", "error")
+            return redirect(url_for("index"))
+
         with open(watch["history"][newest], "r") as f:
             content = f.readlines()
 
@@ -878,13 +932,16 @@ def changedetection_app(config=None, datastore_o=None):
         ) as zipObj:
 
             # Be sure we're written fresh
-            datastore.sync_to_json()
+            datastore.sync_to_disk(checkpoint=True)
 
             # Add the index
-            zipObj.write(
-                os.path.join(app.config["datastore_path"], "url-watches.json"),
-                arcname="url-watches.json",
-            )
+            if datastore.sqlite_store:
+                zipObj.write(datastore.sqlite_store.db_path, arcname="url-watches.db")
+            else:
+                zipObj.write(
+                    os.path.join(app.config["datastore_path"], "url-watches.json"),
+                    arcname="url-watches.json",
+                )
 
             # Add the flask app secret
             zipObj.write(
@@ -949,7 +1006,7 @@ def changedetection_app(config=None, datastore_o=None):
             # @todo add_watch should throw a custom Exception for validation etc
             new_uuid = datastore.add_watch(url=url, tag=request.form.get("tag").strip())
             # Straight into the queue.
-            update_q.put(new_uuid)
+            update_q.put(new_uuid, interactive=True)
 
             flash("Watch added.")
             return redirect(url_for("index"))
@@ -976,7 +1033,7 @@ def changedetection_app(config=None, datastore_o=None):
             uuid = list(datastore.data["watching"].keys()).pop()
 
         new_uuid = datastore.clone(uuid)
-        update_q.put(new_uuid)
+        update_q.put(new_uuid, interactive=True)
         flash("Cloned.")
 
         return redirect(url_for("index"))
@@ -989,15 +1046,10 @@ def changedetection_app(config=None, datastore_o=None):
         uuid = request.args.get("uuid")
         i = 0
 
-        running_uuids = []
-        for t in running_update_threads:
-            running_uuids.append(t.current_uuid)
-
-        # @todo check thread is running and skip
-
+        # Watches already being checked are skipped, put() drops the ones that are already queued
         if uuid:
-            if uuid not in running_uuids:
-                update_q.put(uuid)
+            if not update_q.is_in_flight(uuid):
+                update_q.put(uuid, interactive=True)
             i = 1
 
         elif tag != None:
@@ -1005,10 +1057,10 @@ def changedetection_app(config=None, datastore_o=None):
             for watch_uuid, watch in datastore.data["watching"].items():
                 if tag != None and tag in watch["tag"]:
                     if (
-                        watch_uuid not in running_uuids
+                        not update_q.is_in_flight(watch_uuid)
                         and not datastore.data["watching"][watch_uuid]["paused"]
                     ):
-                        update_q.put(watch_uuid)
+                        update_q.put(watch_uuid, interactive=True)
                         i += 1
 
         else:
@@ -1016,14 +1068,111 @@ def changedetection_app(config=None, datastore_o=None):
             for watch_uuid, watch in datastore.data["watching"].items():
 
                 if (
-                    watch_uuid not in running_uuids
+                    not update_q.is_in_flight(watch_uuid)
                     and not datastore.data["watching"][watch_uuid]["paused"]
                 ):
-                    update_q.put(watch_uuid)
+                    update_q.put(watch_uuid, interactive=True)
                     i += 1
         flash("{} watches are rechecking.".format(i))
         return redirect(url_for("index", tag=tag))
 
+    @app.route("/api/stats", methods=["GET"])
+    @login_required
+    def api_stats():
+        from changedetectionio.http_session_pool import session_pool
+        from changedetectionio.webdriver_pool import driver_pool
+        from changedetectionio import stats
+
+        counters = stats.get_counters()
+        skipped = counters.get("checks_not_modified", 0) + counters.get("checks_body_unchanged", 0)
+
+        return {
+            "queue": {"queued": update_q.qsize(), "in_flight": len(update_q.in_flight)},
+            "workers": len(worker_pool),
+            "http_connections": session_pool.stats(),
+            "webdriver_sessions": driver_pool.stats(),
+            "counters": counters,
+            # Percentage of the fetched pages that did not need processing
+            "skip_rate": round(100 * skipped / counters["checks"], 1) if counters.get("checks") else 0,
+        }
+
+    # Remote workers (changedetection.py --worker <url>) take jobs from the same queue as the local workers
+    # Only enabled when the WORKER_TOKEN env var is set, the workers have to send the same token
+    def remote_worker_allowed():
+        import hmac
+
+        token = os.getenv("WORKER_TOKEN")
+        return bool(token) and hmac.compare_digest(request.headers.get("X-Worker-Token", ""), token)
+
+    @app.route("/api/worker/next-job", methods=["GET"])
+    def api_worker_next_job():
+        if not remote_worker_allowed():
+            abort(403)
+
+        try:
+            uuid = update_q.get(block=False)
+        except queue.Empty:
+            return "", 204
+
+        # Shutting down
+        if uuid is None:
+            return "", 204
+
+        watch = datastore.data["watching"].get(uuid)
+        if not watch:
+            update_q.task_done(uuid)
+            return "", 204
+
+        remote_jobs[uuid] = time.time()
+
+        # The history is not needed for a check, and the password hash, RSS token, notification URLs and
+        # proxy usernames/passwords should not leave this instance
+        from changedetectionio.proxy import strip_proxy_credentials
+
+        def without_secrets(d, remove):
+            d = {k: v for k, v in d.items() if k not in remove}
+            d["notification_urls"] = []
+            d["proxies"] = [strip_proxy_credentials(p) for p in d.get("proxies", [])]
+            d["bad_proxies"] = [strip_proxy_credentials(p) for p in d.get("bad_proxies", [])]
+            d["bad_proxies_counter"] = {}
+            return d
+
+        application = without_secrets(datastore.data["settings"]["application"], ["password", "rss_access_token"])
+        watch = without_secrets(watch, ["history"])
+        return {
+            "uuid": uuid,
+            "watch": watch,
+            "settings": dict(datastore.data["settings"], application=application),
+        }
+
+    @app.route("/api/worker/result", methods=["POST"])
+    def api_worker_result():
+        if not remote_worker_allowed():
+            abort(403)
+
+        from changedetectionio import update_worker
+        import base64
+
+        result = request.get_json()
+        uuid = result["uuid"]
+
+        # Already given up on, it could be queued again by now
+        if uuid not in remote_jobs:
+            abort(409)
+
+        if uuid in datastore.data["watching"]:
+            if result.get("error"):
+                datastore.update_watch(uuid=uuid, update_obj={"last_error": str(result["error"])})
+            else:
+                datastore.update_watch(uuid=uuid, update_obj={"fetch_time": result["fetch_time"]})
+                # Anything else (the history, URL, notification settings..) is not for a worker to change
+                update_obj = {k: v for k, v in result["update_obj"].items() if k in remote_result_fields}
+                update_worker.process_check_result(datastore, notification_q, uuid, result["changed_detected"],
+                                                   update_obj, base64.b64decode(result["contents"]))
+
+        remote_job_done(uuid)
+        return "", 204
+
     # @todo handle ctrl break
     ticker_thread = threading.Thread(
         target=ticker_thread_check_time_launch_checks
@@ -1070,15 +1219,31 @@ def check_for_new_version():
         app.config.exit.wait(86400)
 
 
+# Set the exit flag and wake up the worker and notification threads that are waiting on their queues
+def stop_threads():
+    from changedetectionio import content_fetcher
+    from changedetectionio.webdriver_pool import driver_pool
+
+    app.config.exit.set()
+    update_q.close()
+    notification_q.put(None)
+    driver_pool.close_all()
+    content_fetcher.stop_async_loop()
+
+
 def notification_runner():
     while not app.config.exit.is_set():
         try:
             # At the moment only one thread runs (single runner)
-            n_object = notification_q.get(block=False)
+            n_object = notification_q.get(timeout=1)
         except queue.Empty:
-            time.sleep(1)
+            pass
 
         else:
+            # Shutting down, see stop_threads()
+            if n_object is None:
+                break
+
             # Process notifications
             try:
                 from changedetectionio import notification
@@ -1090,57 +1255,40 @@ def notification_runner():
 
 
 # Thread runner to check every minute, look for new watches to feed into the Queue.
-def ticker_thread_check_time_launch_checks():
-    from changedetectionio import update_worker
-    import logging
+def remote_job_done(uuid):
+    # Only once, the result could arrive just as the job is given up on
+    if remote_jobs.pop(uuid, None) is None:
+        return
+    watch_scheduler.schedule(uuid)
+    update_q.task_done(uuid)
 
+
+# The remote worker that took the job went away, let the watch be scheduled again
+# Done from the ticker so it still happens when no remote worker asks for jobs anymore
+def expire_remote_jobs():
+    for uuid, started in list(remote_jobs.items()):
+        if time.time() - started > remote_job_timeout:
+            remote_job_done(uuid)
+
+
+def ticker_thread_check_time_launch_checks():
     # Spin up Workers.
-    for _ in range(datastore.data["settings"]["requests"]["workers"]):
-        new_worker = update_worker.update_worker(
-            update_q, notification_q, app, datastore
-        )
-        running_update_threads.append(new_worker)
-        new_worker.start()
+    worker_pool.resize()
+
+    watch_scheduler.schedule_all()
 
     while not app.config.exit.is_set():
 
-        # Get a list of watches by UUID that are currently fetching data
-        running_uuids = []
-        for t in running_update_threads:
-            if t.current_uuid:
-                running_uuids.append(t.current_uuid)
+        # Only the watches that are due come out of the scheduler, they go back in when their check is done
+        # Skip the ones already queued or currently fetching data
+        for uuid in watch_scheduler.pop_due():
+            if uuid not in update_q:
+                update_q.put(uuid)
 
-        # Re #232 - Deepcopy the data incase it changes while we're iterating through it all
-        copied_datastore = deepcopy(datastore)
+        expire_remote_jobs()
 
-        # Check for watches outside of the time threshold to put in the thread queue.
-        for uuid, watch in copied_datastore.data["watching"].items():
-            # If they supplied an individual entry minutes to threshold.
-            if (
-                "minutes_between_check" in watch
-                and watch["minutes_between_check"] is not None
-            ):
-                # Cast to int just incase
-                max_time = int(
-                    watch["minutes_between_check"]
-                )  # multiply by *60 to convert to minutes
-            else:
-                # Default system wide.
-                max_time = int(
-                    copied_datastore.data["settings"]["requests"][
-                        "minutes_between_check"
-                    ]
-                )  # multiply by *60 to convert to minutes
-
-            threshold = time.time() - max_time
-            logging.info("#timecheck", max_time, "now time", threshold)
-            # Yeah, put it in the queue, it's more than time.
-            if not watch["paused"] and watch["last_checked"] <= threshold:
-                if not uuid in running_uuids and uuid not in update_q.queue:
-                    update_q.put(uuid)
-
-        # Wait a few seconds before checking the list again
-        time.sleep(3)
+        # Grow or shrink the number of workers to fit what is queued now
+        worker_pool.resize()
 
         # Should be low so we can break this out in testing
         app.config.exit.wait(1)
@@ -0,0 +1,140 @@
+import codecs
+import re
+
+# Working out the encoding of a response body, cheapest way first
+# 1. charset= in the Content-Type header (JSON is always UTF-8 without it)
+# 2. Byte Order Mark
+# 3. <meta charset> / <meta http-equiv="Content-Type"> / <?xml encoding> in the first few KB
+# 4. Valid UTF-8
+# 5. The encoding that was found for this watch last time, when it still decodes
+# 6. cchardet (C) when installed and it's sure enough
+# 7. chardet over the whole body, this one is pure Python and slow on big pages (charset_normalizer without chardet)
+#
+# requests' r.text instead goes straight to a detector (or ISO-8859-1 for text/*) when there's no charset header
+
+try:
+    import cchardet
+except ImportError:
+    cchardet = None
+
+try:
+    import charset_normalizer
+except ImportError:
+    charset_normalizer = None
+
+try:
+    import chardet
+except ImportError:
+    chardet = None
+
+# Below this cchardet's guess is checked again with chardet
+cchardet_min_confidence = 0.5
+
+# How much of the start of the body is searched for <meta charset>
+sniff_bytes = 4096
+
+header_charset_re = re.compile(r'charset\s*=\s*["\']?\s*([^\s;"\']+)', re.IGNORECASE)
+meta_charset_re = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([a-zA-Z0-9_.:-]+)', re.IGNORECASE)
+xml_encoding_re = re.compile(rb'^\s*<\?xml[^>]+encoding\s*=\s*["\']([a-zA-Z0-9_.:-]+)["\']')
+
+boms = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+
+# The Python codec name, or None when it's not an encoding Python knows
+def normalise_encoding(name):
+    if isinstance(name, bytes):
+        name = name.decode('ascii', errors='ignore')
+    try:
+        return codecs.lookup(name.strip()).name
+    except (LookupError, AttributeError):
+        return None
+
+
+def from_header(content_type):
+    if not content_type:
+        return None
+
+    m = header_charset_re.search(content_type)
+    if m:
+        return normalise_encoding(m.group(1))
+
+    # RFC 8259, JSON text is UTF-8
+    if 'json' in content_type.lower():
+        return 'utf-8'
+
+    return None
+
+
+def from_bom(content):
+    for bom, encoding in boms:
+        if content.startswith(bom):
+            return encoding
+
+    return None
+
+
+def from_markup(content):
+    head = content[:sniff_bytes]
+    m = xml_encoding_re.search(head) or meta_charset_re.search(head)
+    if m:
+        encoding = normalise_encoding(m.group(1))
+        # The page is already bytes, a <meta> saying UTF-16 can't be right (same as what browsers do)
+        if encoding and encoding.startswith('utf-16'):
+            return 'utf-8'
+        return encoding
+
+    return None
+
+
+def from_detector(content):
+    if cchardet:
+        result = cchardet.detect(content)
+        if result.get('encoding') and (result.get('confidence') or 0) >= cchardet_min_confidence:
+            encoding = normalise_encoding(result['encoding'])
+            if encoding:
+                return encoding
+
+    if chardet:
+        return normalise_encoding(chardet.detect(content).get('encoding') or '')
+
+    if charset_normalizer:
+        best = charset_normalizer.from_bytes(content).best()
+        if best:
+            return normalise_encoding(best.encoding)
+
+    return None
+
+
+def decode_with(content, encoding, errors='strict', truncated=False):
+    if truncated:
+        # Cut off at the size limit, maybe in the middle of a multi-byte character, that last one is left out
+        return codecs.getincrementaldecoder(encoding)(errors=errors).decode(content)
+    return content.decode(encoding, errors=errors)
+
+
+# Returns the text and the encoding that was used
+# 'known_encoding' is what was used for the same watch last time
+# 'truncated' when the body was cut off at the maximum size instead of ending where the page ends
+def decode(content, content_type=None, known_encoding=None, truncated=False):
+    encoding = from_header(content_type) or from_bom(content) or from_markup(content)
+
+    if not encoding:
+        for encoding in ['utf-8', known_encoding]:
+            if encoding:
+                try:
+                    return decode_with(content, encoding, truncated=truncated), encoding
+                except (UnicodeDecodeError, LookupError):
+                    pass
+
+        encoding = from_detector(content) or 'utf-8'
+
+    try:
+        return decode_with(content, encoding, errors='replace', truncated=truncated), encoding
+    except LookupError:
+        return decode_with(content, 'utf-8', errors='replace', truncated=truncated), 'utf-8'
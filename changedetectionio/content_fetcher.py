@@ -1,8 +1,8 @@
+import asyncio
 import os
+import threading
 import time
 from abc import ABC, abstractmethod
-from selenium import webdriver
-from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
 from selenium.common.exceptions import WebDriverException
 import urllib3.exceptions
 
@@ -15,6 +15,13 @@ class Fetcher:
     error = None
     status_code = None
     content = None  # Should be bytes?
+    headers = {}  # Response headers, if the fetcher knows them
+    encoding = None  # What the body was decoded with, set before run() to what worked for this watch last time
+    max_body_size = None  # Bytes, set before run(), anything after this is cut off (None/0 = no limit)
+    truncated = False  # The body was bigger than max_body_size
+
+    # Download this much of the body at a time
+    chunk_size = 64 * 1024
 
     fetcher_description = "No description"
 
@@ -46,6 +53,44 @@ class Fetcher:
 #        return
 
 
+# Reads the body chunk by chunk so a huge download can't fill up the memory, stops after max_body_size bytes
+# Returns (body, truncated)
+def read_limited(chunks, max_body_size):
+    body = bytearray()
+    for chunk in chunks:
+        body += chunk
+        if max_body_size and len(body) > max_body_size:
+            return bytes(body[:max_body_size]), True
+
+    return bytes(body), False
+
+
+# Only ask for the Content-Encodings that can be decoded, 'br' and 'zstd' depend on which packages are installed
+def filter_accept_encoding(request_headers, supported):
+    if 'Accept-Encoding' not in request_headers:
+        return request_headers
+
+    accepted = []
+    for coding in request_headers['Accept-Encoding'].split(','):
+        name = coding.split(';')[0].strip().lower()
+        if name in supported or name == 'identity':
+            accepted.append(coding.strip())
+
+    request_headers = dict(request_headers)
+    request_headers['Accept-Encoding'] = ', '.join(accepted) or 'identity'
+    return request_headers
+
+
+# Bytes sent over the network and after decoding, per Content-Encoding, to see what the compression saves
+def record_transfer(headers, received, decoded):
+    from changedetectionio import stats
+
+    content_encoding = headers.get('Content-Encoding', 'identity').replace(' ', '').lower() or 'identity'
+    if received is not None:
+        stats.increment('bytes_received_' + content_encoding, received)
+    stats.increment('bytes_decoded_' + content_encoding, decoded)
+
+
 def available_fetchers():
     import inspect
     from changedetectionio import content_fetcher
@@ -62,6 +107,29 @@ def available_fetchers():
     return p
 
 
+# Runs in the page on every poll, the first call also starts watching the DOM for changes
+# A change is any DOM mutation, or another resource (XHR, image, script..) finished loading
+settled_script = """
+var w = window;
+if (!w.__changedetection_observer && document.documentElement) {
+    w.__changedetection_last_change = Date.now();
+    w.__changedetection_observer = new MutationObserver(function () { w.__changedetection_last_change = Date.now(); });
+    w.__changedetection_observer.observe(document.documentElement,
+        {childList: true, subtree: true, attributes: true, characterData: true});
+}
+var resources = performance.getEntriesByType ? performance.getEntriesByType('resource').length : 0;
+if (w.__changedetection_resources !== resources) {
+    w.__changedetection_resources = resources;
+    w.__changedetection_last_change = Date.now();
+}
+var found = null;
+if (arguments[0]) {
+    try { found = !!document.querySelector(arguments[0]); } catch (e) { found = false; }
+}
+return {ready: document.readyState, quiet: Date.now() - (w.__changedetection_last_change || 0), found: found};
+"""
+
+
 class html_webdriver(Fetcher):
     if os.getenv("WEBDRIVER_URL"):
         fetcher_description = "WebDriver Chrome/Javascript via '{}'".format(
@@ -72,47 +140,90 @@ class html_webdriver(Fetcher):
 
     command_executor = ""
 
+    # Set before run(), from the watch
+    wait_for_selector = None  # CSS selector of an element that shows the page is done
+    max_wait = 10  # Seconds, the page is used as it is after this long
+
+    # Nothing changed in the DOM for this long means the page is done (when there's no selector to wait for)
+    quiet_seconds = 0.5
+    poll_seconds = 0.1
+
     def __init__(self):
         self.command_executor = os.getenv(
             "WEBDRIVER_URL", "http://browser-chrome:4444/wd/hub"
         )
 
-    def run(self, url, timeout, request_headers, datastore=None):
+    # Instead of a fixed sleep, wait until the document is loaded and then either the 'wait_for_selector' element
+    # is there, or the DOM stopped changing. Returns False when max_wait ran out first.
+    def wait_until_settled(self, driver):
+        deadline = time.time() + self.max_wait
+        while True:
+            state = driver.execute_script(settled_script, self.wait_for_selector or None)
+            if state['ready'] == 'complete':
+                if self.wait_for_selector:
+                    if state['found']:
+                        return True
+                elif state['quiet'] >= self.quiet_seconds * 1000:
+                    return True
+
+            if time.time() >= deadline:
+                return False
+            time.sleep(self.poll_seconds)
 
-        # check env for WEBDRIVER_URL
-        driver = webdriver.Remote(
-            command_executor=self.command_executor,
-            desired_capabilities=DesiredCapabilities.CHROME,
-        )
+    def run(self, url, timeout, request_headers, datastore=None):
+        from changedetectionio.webdriver_pool import driver_pool
+
+        max_sessions = None
+        max_uses = 50
+        if datastore:
+            max_sessions = datastore.data["settings"]["requests"]["webdriver_sessions"]
+            max_uses = datastore.data["settings"]["requests"]["webdriver_session_max_uses"]
+
+        # A warm session from the pool, started with WEBDRIVER_URL
+        for attempt in range(2):
+            session = driver_pool.acquire(self.command_executor, max_sessions)
+            reused = session.uses > 0
+            try:
+                session.driver.get(url)
+                break
+            except WebDriverException:
+                # Be sure we close the session window
+                driver_pool.release(session, discard=True)
+                # The WebDriver server could have dropped a session that was waiting in the pool, try a new one once
+                if not reused or attempt:
+                    raise
+            except Exception:
+                # Anything else (connection errors, timeouts..) must still give the session back to the pool
+                driver_pool.release(session, discard=True)
+                raise
 
         try:
-            driver.get(url)
-        except WebDriverException as e:
-            # Be sure we close the session window
-            driver.quit()
-            raise
+            # @todo - how to check this? is it possible?
+            self.status_code = 200
 
-        # @todo - how to check this? is it possible?
-        self.status_code = 200
+            self.wait_until_settled(session.driver)
+            self.content = session.driver.page_source
+        except Exception:
+            driver_pool.release(session, discard=True)
+            raise
 
-        # @todo - dom wait loaded?
-        time.sleep(5)
-        self.content = driver.page_source
+        driver_pool.release(session, max_uses)
 
-        driver.quit()
+        # The browser already has the whole page, but at least don't process and store all of it
+        if self.max_body_size:
+            body = self.content.encode('utf-8')
+            if len(body) > self.max_body_size:
+                self.content = body[:self.max_body_size].decode('utf-8', errors='ignore')
+                self.truncated = True
 
     def is_ready(self):
-        from selenium import webdriver
-        from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
-        from selenium.common.exceptions import WebDriverException
+        from changedetectionio.webdriver_pool import driver_pool
 
-        driver = webdriver.Remote(
-            command_executor=self.command_executor,
-            desired_capabilities=DesiredCapabilities.CHROME,
-        )
+        if driver_pool.has_session(self.command_executor):
+            return True
 
-        # driver.quit() seems to cause better exceptions
-        driver.quit()
+        # Starting one shows any connection problem, and it stays in the pool for the first check
+        driver_pool.release(driver_pool.acquire(self.command_executor))
 
         return True
 
@@ -121,10 +232,24 @@ class html_webdriver(Fetcher):
 class html_requests(Fetcher):
     fetcher_description = "Basic fast Plaintext/HTTP Client (Can use proxy)"
 
+    def read_body(self, r):
+        body, self.truncated = read_limited(r.iter_content(chunk_size=self.chunk_size), self.max_body_size)
+        # Still compressed, how much actually came over the network
+        record_transfer(r.headers, r.raw.tell(), len(body))
+        # The rest of the body is still on the way, the connection can't be used again
+        if self.truncated:
+            r.close()
+        return body
+
     def run(self, url, timeout, request_headers, datastore=None):
-        import requests
-        from itertools import cycle
+        from changedetectionio import charset_detection
+        from changedetectionio.http_session_pool import session_pool
 
+        # urllib3 knows which decoders are installed
+        request_headers = filter_accept_encoding(request_headers, urllib3.util.request.ACCEPT_ENCODING.split(','))
+
+        pool_maxsize = datastore.data["settings"]["requests"]["pool_maxsize"]
+        pool_idle_timeout = datastore.data["settings"]["requests"]["pool_idle_timeout"]
         proxies = datastore.data["settings"]["application"]["proxies"]
         use_proxy = datastore.data["settings"]["application"]["use_proxy"]
         html = None
@@ -134,13 +259,15 @@ class html_requests(Fetcher):
             for i in range(0, len(proxies)):
                 proxy = proxies[i]
                 try:
-                    r = requests.get(
+                    session = session_pool.get_session(url, proxy, pool_maxsize, pool_idle_timeout)
+                    r = session.get(
                         url,
                         headers=request_headers,
                         timeout=timeout,
                         verify=False,
-                        proxies={"http": proxy, "https": proxy},
+                        stream=True,
                     )
+                    body = self.read_body(r)
                     datastore.data["settings"]["application"]["bad_proxies_counter"][
                         proxy
                     ] = 0
@@ -149,7 +276,7 @@ class html_requests(Fetcher):
                                     "bad_proxies"
                                 ].index(proxy)
                             )
-                    html = r.text
+                    html, self.encoding = charset_detection.decode(body, r.headers.get('Content-Type'), self.encoding, self.truncated)
                     print(f"Proxy currently being used: {proxy} Res: {r}")
                     break
                 except Exception as e:
@@ -178,19 +305,155 @@ class html_requests(Fetcher):
                                 datastore.data["settings"]["application"]["use_proxy"] = False
                         count = 0
         else:
-            r = requests.get(
-                url, headers=request_headers, timeout=timeout, verify=False
+            session = session_pool.get_session(url, None, pool_maxsize, pool_idle_timeout)
+            r = session.get(
+                url, headers=request_headers, timeout=timeout, verify=False, stream=True
             )
-            html = r.text
+            body = self.read_body(r)
+            html, self.encoding = charset_detection.decode(body, r.headers.get('Content-Type'), self.encoding, self.truncated)
         print("bad proxies: ", datastore.data["settings"]["application"]["bad_proxies"])
         print(
             "bad proxies count: ",
             datastore.data["settings"]["application"]["bad_proxies_counter"],
         )
 
+        # Not modified since the If-None-Match/If-Modified-Since we sent, there is no body
+        if r is not None and r.status_code == 304:
+            self.status_code = r.status_code
+            self.headers = r.headers
+            return
+
         # @todo test this
         if not r or not html or not len(html):
             raise EmptyReply(error)
 
         self.status_code = r.status_code
+        self.headers = r.headers
         self.content = html
+
+
+# One event loop in its own thread runs the fetches of every html_async watch, started on first use
+async_loop = None
+async_loop_thread = None
+async_session = None
+async_loop_lock = threading.Lock()
+
+
+def get_async_loop():
+    global async_loop, async_loop_thread
+
+    with async_loop_lock:
+        if async_loop is None:
+            async_loop = asyncio.new_event_loop()
+            async_loop_thread = threading.Thread(target=async_loop.run_forever, name="html_async", daemon=True)
+            async_loop_thread.start()
+
+    return async_loop
+
+
+async def close_async_session():
+    global async_session
+
+    if async_session is not None:
+        session, async_session = async_session, None
+        await session.close()
+
+
+# Closes the aiohttp session (and its open connections) and stops the event loop, see stop_threads()
+# It's started again if another html_async check runs after this
+def stop_async_loop(timeout=5):
+    global async_loop, async_loop_thread
+
+    with async_loop_lock:
+        loop, thread = async_loop, async_loop_thread
+        async_loop = async_loop_thread = None
+
+    if loop is None:
+        return
+
+    try:
+        asyncio.run_coroutine_threadsafe(close_async_session(), loop).result(timeout)
+    except Exception as e:
+        print("Error closing the html_async session", str(e))
+
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout)
+    if not thread.is_alive():
+        loop.close()
+
+
+# Requires the 'aiohttp' package
+class html_async(Fetcher):
+    fetcher_description = "Basic Plaintext/HTTP Client using asyncio, for large numbers of watches (No proxy)"
+
+    # Max connections open at the same time over all the watches
+    connection_limit = 1000
+
+    async def get_session(self):
+        global async_session
+        import aiohttp
+
+        # Only ever runs in the loop thread, so no locking needed
+        if async_session is None:
+            async_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connection_limit, ssl=False)
+            )
+        return async_session
+
+    async def fetch(self, url, timeout, request_headers):
+        import aiohttp
+        from aiohttp import compression_utils
+
+        supported = ['gzip', 'deflate']
+        if getattr(compression_utils, 'HAS_BROTLI', False):
+            supported.append('br')
+        if getattr(compression_utils, 'HAS_ZSTD', False):
+            supported.append('zstd')
+        request_headers = filter_accept_encoding(request_headers, supported)
+
+        session = await self.get_session()
+        async with session.get(url, headers=request_headers, timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+            body = bytearray()
+            async for chunk in r.content.iter_chunked(self.chunk_size):
+                body += chunk
+                if self.max_body_size and len(body) > self.max_body_size:
+                    # Leaving before the end closes the connection instead of putting it back in the pool
+                    self.truncated = True
+                    return r.status, r.headers, bytes(body[:self.max_body_size])
+
+            return r.status, r.headers, bytes(body)
+
+    # Starts the request in the event loop, the Future gives what finish() needs
+    # update_worker doesn't wait for it, see perform_site_check.start()
+    def start(self, url, timeout, request_headers):
+        return asyncio.run_coroutine_threadsafe(self.fetch(url, timeout, request_headers), get_async_loop())
+
+    def finish(self, status_code, headers, body):
+        from changedetectionio import charset_detection
+
+        self.status_code = status_code
+        self.headers = headers
+
+        # Not modified, there is no body
+        if status_code == 304:
+            return
+
+        if not body:
+            raise EmptyReply(None)
+
+        # aiohttp has already decompressed it, the Content-Length (when there is one) is the size on the network
+        received = headers.get('Content-Length')
+        record_transfer(headers, int(received) if received and received.isdigit() else None, len(body))
+
+        self.content, self.encoding = charset_detection.decode(body, headers.get('Content-Type'), self.encoding, self.truncated)
+
+    def run(self, url, timeout, request_headers, datastore=None):
+        self.finish(*self.start(url, timeout, request_headers).result())
+
+    def is_ready(self):
+        import importlib.util
+
+        if importlib.util.find_spec("aiohttp") is None:
+            raise Exception("The 'aiohttp' package is not installed, install it with 'pip3 install aiohttp'")
+
+        return True
@@ -5,56 +5,262 @@ from inscriptis import get_text
 import urllib3
 from . import html_tools
 import re
+import threading
+import json
+import os
+from concurrent.futures import Future
+from functools import lru_cache
+from changedetectionio import stats
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Only these watch fields are sent to process_fetched_content()
+processing_watch_keys = ['css_filter', 'ignore_text', 'trigger_text', 'previous_md5', 'title', 'extract_title_as_title']
 
-# Some common stuff here that can be moved to a base class
-class perform_site_check():
+process_pool = None
+process_pool_size = 0
+process_pool_lock = threading.Lock()
 
-    def __init__(self, *args, datastore, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.datastore = datastore
+completion_pool = None
 
-    def strip_ignore_text(self, content, list_ignore_text):
-        import re
-        ignore = []
-        ignore_regex = []
-        for k in list_ignore_text:
 
+# Process pool for process_fetched_content(), (re)created when settings.requests.filter_processes changes
+def get_process_pool(size):
+    global process_pool, process_pool_size
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+
+    with process_pool_lock:
+        if process_pool is None or process_pool_size != size:
+            if process_pool is not None:
+                process_pool.shutdown(wait=False)
+            # 'spawn', forking a process that is running a lot of threads can leave locks stuck in the child
+            process_pool = ProcessPoolExecutor(max_workers=size, mp_context=multiprocessing.get_context("spawn"))
+            process_pool_size = size
+
+    return process_pool
+
+
+# Threads that filter and compare the html_async pages once they are fetched, so that isn't done in the event loop
+def get_completion_pool():
+    global completion_pool
+    from concurrent.futures import ThreadPoolExecutor
+
+    with process_pool_lock:
+        if completion_pool is None:
+            completion_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="html_async_results")
+
+    return completion_pool
+
+
+# All the ignore rules of a watch compiled into one regex, so each line is only searched once
+# - Plain text is matched case sensitive, as re.escape()'d alternatives
+# - /regex/ rules are matched case insensitive, in a (?i:...) group
+# Regexes that can't be combined (their own capture groups/backreferences or global flags) are kept separate,
+# invalid regexes are skipped.
+class IgnoreTextMatcher:
+
+    def __init__(self, list_ignore_text):
+        alternatives = []
+        self.separate = []
+
+        for k in list_ignore_text:
             # Is it a regex?
             if k[0] == '/':
-                ignore_regex.append(k.strip(" /"))
+                regex = k.strip(" /")
+                try:
+                    compiled = re.compile(regex, re.IGNORECASE)
+                except re.error:
+                    continue
+
+                try:
+                    if compiled.groups:
+                        raise re.error("Has groups")
+                    re.compile("(?i:{})".format(regex))
+                    alternatives.append("(?i:{})".format(regex))
+                except re.error:
+                    self.separate.append(compiled)
             else:
-                ignore.append(k)
+                alternatives.append(re.escape(k))
 
-        output = []
-        for line in content.splitlines():
+        self.combined = re.compile("|".join(alternatives)) if alternatives else None
 
-            # Always ignore blank lines in this mode. (when this function gets called)
-            if len(line.strip()):
-                regex_matches = False
+    def matches(self, line):
+        if self.combined and self.combined.search(line):
+            return True
+        return any(regex.search(line) for regex in self.separate)
 
-                # if any of these match, skip
-                for regex in ignore_regex:
-                    try:
-                        if re.search(regex, line, re.IGNORECASE):
-                            regex_matches = True
-                    except Exception as e:
-                        continue
 
-                if not regex_matches and not any(skip_text in line for skip_text in ignore):
-                    output.append(line.encode('utf8'))
+# Compiled once per list of rules and reused until the watch's ignore_text changes
+@lru_cache(maxsize=1024)
+def get_ignore_text_matcher(ignore_text):
+    return IgnoreTextMatcher(ignore_text)
 
-        return "\n".encode('utf8').join(output)
 
+def strip_ignore_text(content, list_ignore_text):
+    matcher = get_ignore_text_matcher(tuple(list_ignore_text))
 
+    output = []
+    for line in content.splitlines():
 
-    def run(self, uuid):
-        timestamp = int(time.time())  # used for storage etc too
+        # Always ignore blank lines in this mode. (when this function gets called)
+        if len(line.strip()) and not matcher.matches(line):
+            output.append(line.encode('utf8'))
 
-        changed_detected = False
-        stripped_text_from_html = ""
+    return "\n".encode('utf8').join(output)
+
+
+# All the trigger text of a watch, compiled once and reused until it changes
+# The text is lowercased once for all the plain text triggers, and the search stops at the first trigger found.
+# Plain text is checked first, a substring search is much cheaper than a regex over the whole document.
+class TriggerTextMatcher:
+
+    def __init__(self, trigger_text):
+        self.plain = []
+        self.regexes = []
+
+        for line in trigger_text:
+            if not len(line):
+                continue
+
+            if line[0] == '/' and line[-1] == '/':
+                try:
+                    self.regexes.append(re.compile(line.strip('/'), re.IGNORECASE))
+                except re.error:
+                    continue
+            else:
+                self.plain.append(line.lower())
+
+    def matches(self, text):
+        if self.plain:
+            lowered = text.lower()
+            if any(line in lowered for line in self.plain):
+                return True
+        return any(regex.search(text) for regex in self.regexes)
+
+
+@lru_cache(maxsize=1024)
+def get_trigger_text_matcher(trigger_text):
+    return TriggerTextMatcher(trigger_text)
+
+
+# Everything after the fetch, parsing, filtering, the checksum and the trigger text
+# This is where the CPU time goes, it only takes and returns plain data so it can be run in another process.
+# 'html_parser' is settings.requests.html_parser, the parser for CSS filters ('xpath:' filters always use lxml)
+def process_fetched_content(content, status_code, watch, extract_title_as_title, update_obj, html_parser='html.parser'):
+    changed_detected = False
+    stripped_text_from_html = ""
+    timestamp = update_obj['last_checked']
+
+    # Seconds spent in each step, the HTML is parsed at most once and shared between the steps that need it
+    timings = {'parse': 0, 'filter': 0, 'get_text': 0, 'ignore_text': 0, 'trigger': 0, 'title': 0, 'html_parses': 0}
+    soup = None
+
+    # @todo move to class / maybe inside of fetcher abstract base?
+
+    # @note: I feel like the following should be in a more obvious chain system
+    #  - Check filter text
+    #  - Is the checksum different?
+    #  - Do we convert to JSON?
+    # https://stackoverflow.com/questions/41817578/basic-method-chaining ?
+    # return content().textfilter().jsonextract().checksumcompare() ?
+
+    is_html = True
+    html_content = content
+    css_filter_rule = watch['css_filter']
+    if css_filter_rule and len(css_filter_rule.strip()):
+        if 'json:' in css_filter_rule:
+            now = time.perf_counter()
+            stripped_text_from_html = html_tools.extract_json_as_string(content=content, jsonpath_filter=css_filter_rule)
+            timings['filter'] = time.perf_counter() - now
+            is_html = False
+        else:
+            now = time.perf_counter()
+            soup = html_tools.parse_html(content, html_tools.parser_for_filter(css_filter_rule, html_parser))
+            timings['parse'] = time.perf_counter() - now
+            timings['html_parses'] += 1
+
+            # CSS Filter, extract the HTML that matches and feed that into the existing inscriptis::get_text
+            now = time.perf_counter()
+            html_content = html_tools.css_filter(css_filter=css_filter_rule, soup=soup)
+            timings['filter'] = time.perf_counter() - now
+
+    if is_html:
+        # get_text() via inscriptis
+        now = time.perf_counter()
+        stripped_text_from_html = get_text(html_content)
+        timings['get_text'] = time.perf_counter() - now
+
+    # We rely on the actual text in the html output.. many sites have random script vars etc,
+    # in the future we'll implement other mechanisms.
+
+    update_obj["last_check_status"] = status_code
+    update_obj["last_error"] = False
+
+
+    # If there's text to skip
+    # @todo we could abstract out the get_text() to handle this cleaner
+    now = time.perf_counter()
+    if len(watch['ignore_text']):
+        stripped_text_from_html = strip_ignore_text(stripped_text_from_html, watch['ignore_text'])
+    else:
+        stripped_text_from_html = stripped_text_from_html.encode('utf8')
+    timings['ignore_text'] = time.perf_counter() - now
+
+
+    fetched_md5 = hashlib.md5(stripped_text_from_html).hexdigest()
+
+    blocked_by_not_found_trigger_text = False
+
+    now = time.perf_counter()
+    if len(watch['trigger_text']):
+        # Found it? so we don't wait for it anymore
+        matcher = get_trigger_text_matcher(tuple(watch['trigger_text']))
+        blocked_by_not_found_trigger_text = not matcher.matches(stripped_text_from_html.decode('utf8'))
+    timings['trigger'] = time.perf_counter() - now
+
+
+    # could be None or False depending on JSON type
+    # On the first run of a site, watch['previous_md5'] will be an empty string
+    if not blocked_by_not_found_trigger_text and watch['previous_md5'] != fetched_md5:
+        changed_detected = True
+
+        # Don't confuse people by updating as last-changed, when it actually just changed from None..
+        if watch['previous_md5']:
+            update_obj["last_changed"] = timestamp
+
+        update_obj["previous_md5"] = fetched_md5
+
+    # Extract title as title
+    if is_html:
+        if extract_title_as_title or watch['extract_title_as_title']:
+            if not watch['title'] or not len(watch['title']):
+                now = time.perf_counter()
+                # The CSS filter could have parsed it already
+                if soup is None:
+                    soup = html_tools.parse_html(content, html_parser)
+                    timings['html_parses'] += 1
+                update_obj['title'] = html_tools.extract_element(find='title', soup=soup)
+                timings['title'] = time.perf_counter() - now
+
+    update_obj['check_timings'] = {k: round(v, 4) for k, v in timings.items()}
+
+    return changed_detected, update_obj, stripped_text_from_html
+
+
+# Some common stuff here that can be moved to a base class
+class perform_site_check():
+
+    def __init__(self, *args, datastore, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.datastore = datastore
+
+    def strip_ignore_text(self, content, list_ignore_text):
+        return strip_ignore_text(content, list_ignore_text)
+
+    # The fetcher to use and what to fetch, from the watch and the settings
+    def prepare(self, uuid):
+        timestamp = int(time.time())  # used for storage etc too
 
         watch = self.datastore.data['watching'][uuid]
 
@@ -69,111 +275,133 @@ class perform_site_check():
         request_headers = self.datastore.data['settings']['headers'].copy()
         request_headers.update(extra_headers)
 
-        # https://github.com/psf/requests/issues/4525
-        # Requests doesnt yet support brotli encoding, so don't put 'br' here, be totally sure that the user cannot
-        # do this by accident.
-        if 'Accept-Encoding' in request_headers and "br" in request_headers['Accept-Encoding']:
-            request_headers['Accept-Encoding'] = request_headers['Accept-Encoding'].replace(', br', '')
-
-        # @todo check the failures are really handled how we expect
-
-        else:
-            timeout = self.datastore.data['settings']['requests']['timeout']
-            url = self.datastore.get_val(uuid, 'url')
+        # Only download it again if it changed since the last check
+        if watch.get('etag'):
+            request_headers['If-None-Match'] = watch['etag']
+        if watch.get('last_modified'):
+            request_headers['If-Modified-Since'] = watch['last_modified']
 
-            # Pluggable content fetcher
-            prefer_backend = watch['fetch_backend']
-            if hasattr(content_fetcher, prefer_backend):
-                klass = getattr(content_fetcher, prefer_backend)
-            else:
-                # If the klass doesnt exist, just use a default
-                klass = getattr(content_fetcher, "html_requests")
-
-
-            fetcher = klass()
-            fetcher.run(url, timeout, request_headers,self.datastore)
-            # Fetching complete, now filters
-            # @todo move to class / maybe inside of fetcher abstract base?
-
-            # @note: I feel like the following should be in a more obvious chain system
-            #  - Check filter text
-            #  - Is the checksum different?
-            #  - Do we convert to JSON?
-            # https://stackoverflow.com/questions/41817578/basic-method-chaining ?
-            # return content().textfilter().jsonextract().checksumcompare() ?
-
-            is_html = True
-            css_filter_rule = watch['css_filter']
-            if css_filter_rule and len(css_filter_rule.strip()):
-                if 'json:' in css_filter_rule:
-                    stripped_text_from_html = html_tools.extract_json_as_string(content=fetcher.content, jsonpath_filter=css_filter_rule)
-                    is_html = False
-                else:
-                    # CSS Filter, extract the HTML that matches and feed that into the existing inscriptis::get_text
-                    stripped_text_from_html = html_tools.css_filter(css_filter=css_filter_rule, html_content=fetcher.content)
-
-            if is_html:
-                # CSS Filter, extract the HTML that matches and feed that into the existing inscriptis::get_text
-                html_content = fetcher.content
-                if css_filter_rule and len(css_filter_rule.strip()):
-                    html_content = html_tools.css_filter(css_filter=css_filter_rule, html_content=fetcher.content)
-
-                # get_text() via inscriptis
-                stripped_text_from_html = get_text(html_content)
-
-            # We rely on the actual text in the html output.. many sites have random script vars etc,
-            # in the future we'll implement other mechanisms.
-
-            update_obj["last_check_status"] = fetcher.get_last_status_code()
-            update_obj["last_error"] = False
+        # 'br' and 'zstd' in Accept-Encoding are left out by the fetcher when it can't decode them
 
+        # @todo check the failures are really handled how we expect
+        timeout = self.datastore.data['settings']['requests']['timeout']
+        url = self.datastore.get_val(uuid, 'url')
 
-            # If there's text to skip
-            # @todo we could abstract out the get_text() to handle this cleaner
-            if len(watch['ignore_text']):
-                stripped_text_from_html = self.strip_ignore_text(stripped_text_from_html, watch['ignore_text'])
-            else:
-                stripped_text_from_html = stripped_text_from_html.encode('utf8')
+        klass = self.fetcher_class(uuid)
 
+        # The watch can have its own limit, 0 is no limit
+        max_body_size_mb = watch.get('max_body_size_mb')
+        if max_body_size_mb is None:
+            max_body_size_mb = self.datastore.data['settings']['requests']['max_body_size_mb']
 
-            fetched_md5 = hashlib.md5(stripped_text_from_html).hexdigest()
+        fetcher = klass()
+        fetcher.encoding = watch.get('encoding')
+        fetcher.max_body_size = max_body_size_mb * 1024 * 1024
+        # Only used by html_webdriver
+        fetcher.wait_for_selector = watch.get('webdriver_wait_for')
+        fetcher.max_wait = watch.get('webdriver_max_wait') or self.datastore.data['settings']['requests']['webdriver_max_wait']
 
-            blocked_by_not_found_trigger_text = False
+        check = {'url': url, 'timeout': timeout, 'request_headers': request_headers, 'update_obj': update_obj,
+                 'max_body_size_mb': max_body_size_mb}
+        return fetcher, check
 
-            if len(watch['trigger_text']):
-                blocked_by_not_found_trigger_text = True
-                for line in watch['trigger_text']:
-                    # Because JSON wont serialize a re.compile object
-                    if line[0] == '/' and line[-1] == '/':
-                        regex = re.compile(line.strip('/'), re.IGNORECASE)
-                        # Found it? so we don't wait for it anymore
-                        r = re.search(regex, str(stripped_text_from_html))
-                        if r:
-                            blocked_by_not_found_trigger_text = False
-                            break
+    def fetcher_class(self, uuid):
+        # Pluggable content fetcher
+        prefer_backend = self.datastore.data['watching'][uuid]['fetch_backend']
+        if hasattr(content_fetcher, prefer_backend):
+            return getattr(content_fetcher, prefer_backend)
 
-                    elif line.lower() in str(stripped_text_from_html).lower():
-                        # We found it don't wait for it.
-                        blocked_by_not_found_trigger_text = False
-                        break
+        # If the klass doesnt exist, just use a default
+        return getattr(content_fetcher, "html_requests")
 
+    def run(self, uuid):
+        fetcher, check = self.prepare(uuid)
+        fetcher.run(check['url'], check['timeout'], check['request_headers'], self.datastore)
+        return self.process(uuid, fetcher, check)
+
+    # For html_async watches, starts the fetch and returns a Future of what run() would return, or None for
+    # the other fetchers. Nothing waits for the fetch, the filtering is done in get_completion_pool() once it's done.
+    def start(self, uuid):
+        result = Future()
+        try:
+            if self.fetcher_class(uuid) is not content_fetcher.html_async:
+                return None
+
+            fetcher, check = self.prepare(uuid)
+            fetch = fetcher.start(check['url'], check['timeout'], check['request_headers'])
+        except Exception as e:
+            result.set_exception(e)
+            return result
+
+        def finish(fetch):
+            try:
+                fetcher.finish(*fetch.result())
+                result.set_result(self.process(uuid, fetcher, check))
+            except Exception as e:
+                result.set_exception(e)
+
+        # The callback runs in the event loop thread, it only hands the page over
+        fetch.add_done_callback(lambda fetch: get_completion_pool().submit(finish, fetch))
+        return result
+
+    # Everything after the fetch
+    def process(self, uuid, fetcher, check):
+        changed_detected = False
+        stripped_text_from_html = ""
 
-            # could be None or False depending on JSON type
-            # On the first run of a site, watch['previous_md5'] will be an empty string
-            if not blocked_by_not_found_trigger_text and watch['previous_md5'] != fetched_md5:
-                changed_detected = True
+        watch = self.datastore.data['watching'][uuid]
+        update_obj = check['update_obj']
+        max_body_size_mb = check['max_body_size_mb']
+        stats.increment('checks')
+
+        # Still checked, but tell the user it was only the start of the page
+        last_error = False
+        if fetcher.truncated:
+            stats.increment('checks_truncated')
+            last_error = "Page is bigger than the {} MB limit, only the first {} MB was checked".format(
+                max_body_size_mb, max_body_size_mb)
+
+        # Not modified, nothing to filter or compare, just record that it was checked
+        if fetcher.get_last_status_code() == 304:
+            stats.increment('checks_not_modified')
+            update_obj["last_error"] = False
+            return False, update_obj, b""
+
+        # Remember these for the next check, the server might not send them anymore
+        update_obj['etag'] = fetcher.headers.get('ETag')
+        update_obj['last_modified'] = fetcher.headers.get('Last-Modified')
+        update_obj['encoding'] = fetcher.encoding
+
+        # Exactly the same page and the same filters as last time, the result would be the same too
+        extract_title_as_title = self.datastore.data['settings']['application']['extract_title_as_title']
+        html_parser = self.datastore.data['settings']['requests']['html_parser']
+        fingerprint = json.dumps([watch['css_filter'], watch['ignore_text'], watch['trigger_text'],
+                                  extract_title_as_title, watch['extract_title_as_title'], html_parser])
+        raw_md5 = hashlib.md5(fingerprint.encode('utf8') + fetcher.content.encode('utf8')).hexdigest()
+        if raw_md5 == watch.get('previous_raw_md5'):
+            stats.increment('checks_body_unchanged')
+            update_obj["last_check_status"] = fetcher.get_last_status_code()
+            update_obj["last_error"] = last_error
+            return False, update_obj, b""
 
-                # Don't confuse people by updating as last-changed, when it actually just changed from None..
-                if self.datastore.get_val(uuid, 'previous_md5'):
-                    update_obj["last_changed"] = timestamp
+        update_obj['previous_raw_md5'] = raw_md5
 
-                update_obj["previous_md5"] = fetched_md5
+        # Fetching complete, now filters
+        processing_watch = {k: watch[k] for k in processing_watch_keys}
 
-            # Extract title as title
-            if is_html:
-                if self.datastore.data['settings']['application']['extract_title_as_title'] or watch['extract_title_as_title']:
-                    if not watch['title'] or not len(watch['title']):
-                        update_obj['title'] = html_tools.extract_element(find='title', html_content=fetcher.content)
+        processes = self.datastore.data['settings']['requests']['filter_processes']
+        if processes:
+            # Only the CPU heavy part goes to the process pool, the fetch above stays in this thread
+            future = get_process_pool(processes).submit(process_fetched_content, fetcher.content,
+                                                        fetcher.get_last_status_code(), processing_watch,
+                                                        extract_title_as_title, update_obj, html_parser)
+            changed_detected, update_obj, stripped_text_from_html = future.result()
+        else:
+            changed_detected, update_obj, stripped_text_from_html = process_fetched_content(
+                fetcher.content, fetcher.get_last_status_code(), processing_watch, extract_title_as_title,
+                update_obj, html_parser)
 
+        if last_error:
+            update_obj["last_error"] = last_error
 
         return changed_detected, update_obj, stripped_text_from_html
@@ -234,6 +234,18 @@ class ValidateCSSJSONInput(object):
             # Re #265 - maybe in the future fetch the page and offer a
             # warning/notice that its possible the rule doesnt yet match anything?
 
+        elif field.data.strip().startswith("xpath:"):
+            from changedetectionio import html_tools
+
+            if not html_tools.has_lxml:
+                raise ValidationError(field.gettext("XPath filters need the 'lxml' package to be installed."))
+
+            try:
+                html_tools.compile_selector(field.data.strip())
+            except html_tools.etree.XPathSyntaxError as e:
+                message = field.gettext("'%s' is not a valid XPath expression. (%s)")
+                raise ValidationError(message % (field.data, str(e)))
+
 
 class quickWatchForm(Form):
     # https://wtforms.readthedocs.io/en/2.3.x/fields/#module-wtforms.fields.html5
@@ -283,8 +295,15 @@ class watchForm(commonSettingsForm):
         "Maximum time in seconds until recheck.",
         [validators.Optional(), validators.NumberRange(min=1)],
     )
+    max_body_size_mb = html5.IntegerField(
+        "Maximum page size in MB", [validators.Optional(), validators.NumberRange(min=0)]
+    )
     css_filter = StringField("CSS/JSON Filter", [ValidateCSSJSONInput()])
     title = StringField("Title")
+    webdriver_wait_for = StringField("Wait for element", [validators.Optional(), validators.Length(max=500)])
+    webdriver_max_wait = html5.IntegerField(
+        "Maximum wait in seconds", [validators.Optional(), validators.NumberRange(min=1, max=300)]
+    )
 
     ignore_text = StringListField("Ignore Text", [ValidateListRegex()])
     headers = StringDictKeyValue("Request Headers")
@@ -307,6 +326,26 @@ class globalSettingsForm(commonSettingsForm):
     minutes_between_check = html5.IntegerField(
         "Maximum time in seconds until recheck", [validators.NumberRange(min=1)]
     )
+    workers_min = html5.IntegerField(
+        "Minimum number of fetch workers", [validators.Optional(), validators.NumberRange(min=1, max=100)]
+    )
+    workers = html5.IntegerField(
+        "Maximum number of fetch workers", [validators.Optional(), validators.NumberRange(min=0, max=100)]
+    )
+    filter_processes = html5.IntegerField(
+        "Processes for filtering content", [validators.Optional(), validators.NumberRange(min=0, max=256)]
+    )
+    max_body_size_mb = html5.IntegerField(
+        "Maximum page size in MB", [validators.Optional(), validators.NumberRange(min=0)]
+    )
+    webdriver_max_wait = html5.IntegerField(
+        "Maximum wait for Javascript pages in seconds", [validators.Optional(), validators.NumberRange(min=1, max=300)]
+    )
+    html_parser = SelectField(
+        "HTML parser for CSS filters",
+        choices=[('html.parser', 'html.parser'), ('lxml', 'lxml')],
+        default='html.parser',
+    )
     extract_title_as_title = BooleanField(
         "Extract <title> from document and use as watch title"
     )
@@ -0,0 +1,60 @@
+import bisect
+
+
+# Sorted index of the snapshot timestamps of a watch
+# watch['history'] is keyed by str(timestamp) and has no reliable order, this keeps the timestamps as sorted ints
+# so newest/previous lookups don't need to convert and sort every key every time.
+# Keys are always handed back as str, the same as they are in watch['history']
+class HistoryIndex:
+
+    def __init__(self, keys=()):
+        self.timestamps = sorted(set(int(k) for k in keys))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def add(self, key):
+        timestamp = int(key)
+        # New snapshots are almost always the newest, so this is usually just an append
+        if not self.timestamps or timestamp > self.timestamps[-1]:
+            self.timestamps.append(timestamp)
+            return
+
+        i = bisect.bisect_left(self.timestamps, timestamp)
+        if i == len(self.timestamps) or self.timestamps[i] != timestamp:
+            self.timestamps.insert(i, timestamp)
+
+    def remove(self, key):
+        timestamp = int(key)
+        i = bisect.bisect_left(self.timestamps, timestamp)
+        if i < len(self.timestamps) and self.timestamps[i] == timestamp:
+            del self.timestamps[i]
+
+    # n=0 is the newest, n=1 the one before that etc, None if there aren't that many
+    def nth_newest(self, n):
+        if n < 0 or n >= len(self.timestamps):
+            return None
+        return str(self.timestamps[-1 - n])
+
+    def newest(self):
+        return self.nth_newest(0)
+
+    # The snapshot before 'key', or before the newest one when no key is given
+    def previous(self, key=None):
+        if key is None:
+            return self.nth_newest(1)
+
+        i = bisect.bisect_left(self.timestamps, int(key))
+        if i == 0:
+            return None
+        return str(self.timestamps[i - 1])
+
+    # Keys between since and until (inclusive), newest first
+    def range(self, since=None, until=None):
+        lo = 0 if since is None else bisect.bisect_left(self.timestamps, int(since))
+        hi = len(self.timestamps) if until is None else bisect.bisect_right(self.timestamps, int(until))
+        return [str(t) for t in reversed(self.timestamps[lo:hi])]
+
+    # All keys, newest first
+    def keys(self):
+        return self.range()
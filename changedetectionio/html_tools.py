@@ -1,83 +1,226 @@
 import json
+from functools import lru_cache
 from bs4 import BeautifulSoup
+from jsonpath_ng import Child, Fields, Root, Slice
 from jsonpath_ng.ext import parse
 
+# lxml is needed for 'xpath:' filters, and it can be chosen for CSS filters too (settings.requests.html_parser)
+# lxml+cssselect is much faster on big pages, but it repairs broken HTML differently from html.parser and doesn't
+# know soupsieve's own selectors like :-soup-contains(), so the text (and checksum) of a watch could change.
+# BeautifulSoup's html.parser with soupsieve stays the default.
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+    from lxml.cssselect import CSSSelector, SelectorError
+    has_lxml = True
+except ImportError:
+    has_lxml = False
+
+# With ijson, simple JSONPath filters are run while reading the JSON, so only the matching values are ever
+# built as Python objects instead of the whole document
+try:
+    import ijson
+    has_ijson = True
+except ImportError:
+    has_ijson = False
+
 
 class JSONNotFound(ValueError):
     def __init__(self, msg):
         ValueError.__init__(self, msg)
 
-# Given a CSS Rule, and a blob of HTML, return the blob of HTML that matches
-def css_filter(css_filter, html_content):
-    soup = BeautifulSoup(html_content, "html.parser")
+
+# Returns a BeautifulSoup document, or an lxml one with parser='lxml' (when it's installed and can make sense of it)
+def parse_html(html_content, parser='html.parser'):
+    if parser == 'lxml' and has_lxml:
+        try:
+            try:
+                return lxml_html.document_fromstring(html_content)
+            except ValueError:
+                # "Unicode strings with encoding declaration are not supported"
+                return lxml_html.document_fromstring(html_content.encode('utf-8'))
+        except (etree.ParserError, ValueError):
+            pass
+
+    return BeautifulSoup(html_content, "html.parser")
+
+
+# Filters are compiled once and then reused for every check of every watch that has the same filter
+@lru_cache(maxsize=1024)
+def compile_selector(css_filter):
+    if css_filter.startswith('xpath:'):
+        return etree.XPath(css_filter[len('xpath:'):].strip())
+    # The HTML translator, tag names are case insensitive and :checked, :link etc work like with soupsieve
+    return CSSSelector(css_filter, translator='html')
+
+
+# The parser that parse_html() should use for this filter, XPath only works on an lxml document
+def parser_for_filter(css_filter, html_parser='html.parser'):
+    return 'lxml' if css_filter.startswith('xpath:') else html_parser
+
+
+# Given a CSS Rule (or 'xpath:' rule), and a blob of HTML, return the blob of HTML that matches
+# Pass 'soup' from parse_html() to reuse a document that is already parsed
+def css_filter(css_filter, html_content=None, soup=None):
+    if soup is None:
+        soup = parse_html(html_content, parser_for_filter(css_filter))
     html_block = ""
-    for item in soup.select(css_filter, separator=""):
-        html_block += str(item)
+
+    if not isinstance(soup, BeautifulSoup):
+        try:
+            selector = compile_selector(css_filter)
+        except SelectorError:
+            # Only soupsieve knows this one, same document but as BeautifulSoup
+            soup = BeautifulSoup(lxml_html.tostring(soup, encoding='unicode'), "html.parser")
+
+    if isinstance(soup, BeautifulSoup):
+        if css_filter.startswith('xpath:'):
+            raise ValueError("XPath filters need the 'lxml' package")
+
+        for item in soup.select(css_filter, separator=""):
+            html_block += str(item)
+
+        return html_block + "\n"
+
+    for item in selector(soup):
+        # XPath can also select text or attribute values
+        if isinstance(item, str):
+            html_block += str(item)
+        else:
+            html_block += lxml_html.tostring(item, encoding='unicode', with_tail=False)
 
     return html_block + "\n"
 
 
 # Extract/find element
-def extract_element(find='title', html_content=''):
+def extract_element(find='title', html_content='', soup=None):
 
     #Re #106, be sure to handle when its not found
     element_text = None
 
-    soup = BeautifulSoup(html_content, 'html.parser')
-    result = soup.find(find)
-    if result and result.string:
-        element_text = result.string.strip()
+    if soup is None:
+        soup = parse_html(html_content)
+
+    if isinstance(soup, BeautifulSoup):
+        result = soup.find(find)
+        if result and result.string:
+            element_text = result.string.strip()
+    else:
+        result = soup.find('.//' + find)
+        # Same as BeautifulSoup's .string, only when the element just has text in it
+        if result is not None and result.text and not len(result):
+            element_text = result.text.strip()
 
     return element_text
 
+# Building the JSONPath parser is slow, so each expression is only parsed once
+@lru_cache(maxsize=1024)
+def compile_jsonpath(jsonpath_filter):
+    return parse(jsonpath_filter)
+
+
+# The ijson prefix for JSONPath filters that are just field names and [*], like $.data.items[*].price
+# None when the filter is anything more than that
+@lru_cache(maxsize=1024)
+def jsonpath_to_ijson_prefix(jsonpath_filter):
+    path = []
+    node = compile_jsonpath(jsonpath_filter)
+    while isinstance(node, Child):
+        path.insert(0, node.right)
+        node = node.left
+    if not isinstance(node, Root):
+        path.insert(0, node)
+
+    prefix = []
+    for step in path:
+        if isinstance(step, Fields) and len(step.fields) == 1:
+            name = step.fields[0]
+            # ijson uses '.' as the separator and 'item' for every item of a list
+            if name in ('*', 'item') or '.' in name:
+                return None
+            prefix.append(name)
+        elif isinstance(step, Slice) and step.start is None and step.end is None and step.step is None:
+            prefix.append('item')
+        else:
+            return None
+
+    return '.'.join(prefix) if prefix else None
+
+
+def _format_json_matches(values):
+    # Re #257 - Better handling where it does not exist, in the case the original 's' value was False..
+    if not values:
+        # Re 265 - Just return an empty string when filter not found
+        return ''
+
+    # Single value, use just the value, as it could be later used in a token in notifications.
+    # More than one result, we will return it as a JSON list.
+    s = values[0] if len(values) == 1 else values
+
+    return json.dumps(s, indent=4)
+
+
 #
 def _parse_json(json_data, jsonpath_filter):
-    s=[]
-    jsonpath_expression = parse(jsonpath_filter.replace('json:', ''))
-    match = jsonpath_expression.find(json_data)
+    match = compile_jsonpath(jsonpath_filter.replace('json:', '')).find(json_data)
+    return _format_json_matches([i.value for i in match])
 
-    # More than one result, we will return it as a JSON list.
-    if len(match) > 1:
-        for i in match:
-            s.append(i.value)
 
-    # Single value, use just the value, as it could be later used in a token in notifications.
-    if len(match) == 1:
-        s = match[0].value
+# Returns None when the JSON could not be streamed and should be loaded the normal way
+def _stream_json(content, jsonpath_filter):
+    prefix = jsonpath_to_ijson_prefix(jsonpath_filter.replace('json:', ''))
+    if prefix is None:
+        return None
 
-    # Re #257 - Better handling where it does not exist, in the case the original 's' value was False..
-    if not match:
-        # Re 265 - Just return an empty string when filter not found
-        return ''
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+
+    try:
+        values = list(ijson.items(content, prefix, use_float=True))
+    except (ijson.JSONError, UnicodeDecodeError):
+        # Not JSON (maybe HTML with <script> JSON), let the normal path deal with it
+        return None
 
-    stripped_text_from_html = json.dumps(s, indent=4)
+    # [*] on an object is the object itself in JSONPath but nothing in ijson, double check the long way
+    if not values:
+        return None
 
-    return stripped_text_from_html
+    return _format_json_matches(values)
 
-def extract_json_as_string(content, jsonpath_filter):
+def extract_json_as_string(content, jsonpath_filter, soup=None):
 
     stripped_text_from_html = False
 
     # Try to parse/filter out the JSON, if we get some parser error, then maybe it's embedded <script type=ldjson>
+    if has_ijson:
+        stripped_text_from_html = _stream_json(content, jsonpath_filter)
+        if stripped_text_from_html is not None:
+            return stripped_text_from_html
+
     try:
         stripped_text_from_html = _parse_json(json.loads(content), jsonpath_filter)
     except json.JSONDecodeError:
 
         # Foreach <script json></script> blob.. just return the first that matches jsonpath_filter
         s = []
-        soup = BeautifulSoup(content, 'html.parser')
-        bs_result = soup.findAll('script')
+        if soup is None:
+            soup = parse_html(content)
+
+        if isinstance(soup, BeautifulSoup):
+            scripts = [result.string for result in soup.findAll('script')]
+        else:
+            scripts = [result.text for result in soup.iter('script')]
 
-        if not bs_result:
+        if not scripts:
             raise JSONNotFound("No parsable JSON found in this document")
 
-        for result in bs_result:
+        for script in scripts:
             # Skip empty tags, and things that dont even look like JSON
-            if not result.string or not '{' in result.string:
+            if not script or not '{' in script:
                 continue
                 
             try:
-                json_data = json.loads(result.string)
+                json_data = json.loads(script)
             except json.JSONDecodeError:
                 # Just skip it
                 continue
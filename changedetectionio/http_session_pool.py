@@ -0,0 +1,87 @@
+import http.cookiejar
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Long lived requests.Session's shared by all the workers, one per scheme + host + proxy
+# Checks of watches on the same site then reuse the open connections instead of doing a new TCP/TLS handshake
+# every time. Sessions that have not been used for 'idle_timeout' seconds are closed.
+# The sessions never keep cookies, a Set-Cookie from one watch must not be sent with the check of another watch
+# (cookies set in the watch request headers are still sent, they are just headers)
+class SessionPool:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (scheme, host, proxy): [session, adapter, last used]
+        self.sessions = {}
+        # Counts from the sessions that were already closed
+        self.closed_connections = 0
+        self.closed_requests = 0
+
+    def get_session(self, url, proxy=None, pool_maxsize=10, idle_timeout=300):
+        parsed = urlparse(url)
+        key = (parsed.scheme, parsed.netloc, proxy)
+        now = time.time()
+
+        with self.lock:
+            self.__close_idle(now, idle_timeout)
+
+            entry = self.sessions.get(key)
+            if entry is None:
+                session = requests.Session()
+                session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                if proxy:
+                    session.proxies = {"http": proxy, "https": proxy}
+                entry = self.sessions[key] = [session, adapter, now]
+
+            entry[2] = now
+
+        return entry[0]
+
+    def __close_idle(self, now, idle_timeout):
+        for key, (session, adapter, last_used) in list(self.sessions.items()):
+            if now - last_used > idle_timeout:
+                connections, requests_made = self.__connection_counts(adapter)
+                self.closed_connections += connections
+                self.closed_requests += requests_made
+                session.close()
+                del self.sessions[key]
+
+    # New connections made and requests sent by the urllib3 pools of one adapter
+    def __connection_counts(self, adapter):
+        connections = 0
+        requests_made = 0
+        for manager in [adapter.poolmanager] + list(adapter.proxy_manager.values()):
+            for pool_key in manager.pools.keys():
+                pool = manager.pools.get(pool_key)
+                if pool:
+                    connections += pool.num_connections
+                    requests_made += pool.num_requests
+
+        return connections, requests_made
+
+    def stats(self):
+        with self.lock:
+            connections = self.closed_connections
+            requests_made = self.closed_requests
+            for session, adapter, last_used in self.sessions.values():
+                c, r = self.__connection_counts(adapter)
+                connections += c
+                requests_made += r
+
+            return {
+                'sessions': len(self.sessions),
+                'requests': requests_made,
+                'connections': connections,
+                'reused': max(0, requests_made - connections),
+            }
+
+
+session_pool = SessionPool()
@@ -0,0 +1,89 @@
+import base64
+import threading
+import time
+
+import requests
+
+
+# Just enough of ChangeDetectionStore for perform_site_check() to run the one job handed out by the coordinator
+class JobDatastore:
+
+    def __init__(self, job):
+        self.data = {"settings": job["settings"], "watching": {job["uuid"]: job["watch"]}}
+
+    def get_val(self, uuid, val):
+        return self.data["watching"][uuid].get(val)
+
+
+# Used in 'changedetection.py --worker <coordinator url>' mode
+# Takes due watches from the coordinator, does the fetch and filtering and sends the result back,
+# the coordinator stays the only one writing to the datastore.
+class RemoteWorker(threading.Thread):
+
+    def __init__(self, coordinator_url, token, exit_event, *args, **kwargs):
+        self.coordinator_url = coordinator_url.rstrip("/")
+        self.exit_event = exit_event
+        self.session = requests.Session()
+        self.session.headers["X-Worker-Token"] = token
+        super().__init__(*args, **kwargs)
+
+    def run(self):
+        while not self.exit_event.is_set():
+            try:
+                r = self.session.get(self.coordinator_url + "/api/worker/next-job", timeout=30)
+                r.raise_for_status()
+            except requests.RequestException as e:
+                print("Could not get a job from the coordinator {} - {}".format(self.coordinator_url, e))
+                self.exit_event.wait(5)
+                continue
+
+            # Nothing is due right now
+            if r.status_code == 204:
+                self.exit_event.wait(1)
+                continue
+
+            result = self.run_job(r.json())
+
+            try:
+                self.session.post(self.coordinator_url + "/api/worker/result", json=result, timeout=30).raise_for_status()
+            except requests.RequestException as e:
+                print("Could not send the result for UUID {} to the coordinator - {}".format(result["uuid"], e))
+
+    def run_job(self, job):
+        from changedetectionio import fetch_site_status
+
+        uuid = job["uuid"]
+        result = {"uuid": uuid}
+        now = time.time()
+
+        try:
+            update_handler = fetch_site_status.perform_site_check(datastore=JobDatastore(job))
+            changed_detected, update_obj, contents = update_handler.run(uuid)
+        except Exception as e:
+            result["error"] = str(e)
+        else:
+            if isinstance(contents, str):
+                contents = contents.encode("utf8")
+            result.update({
+                "changed_detected": changed_detected,
+                "update_obj": update_obj,
+                "contents": base64.b64encode(contents).decode("ascii"),
+            })
+
+        result["fetch_time"] = round(time.time() - now, 3)
+        return result
+
+
+def run_workers(coordinator_url, token, threads):
+    exit_event = threading.Event()
+    workers = [RemoteWorker(coordinator_url, token, exit_event, daemon=True) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+
+    print("Running {} workers for {}".format(threads, coordinator_url))
+
+    try:
+        while any(worker.is_alive() for worker in workers):
+            exit_event.wait(1)
+    except KeyboardInterrupt:
+        exit_event.set()
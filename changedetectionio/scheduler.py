@@ -0,0 +1,80 @@
+import heapq
+import threading
+import time
+
+
+# Keeps the watches in a heap ordered by when they are next due to be checked, so the ticker only has to look at
+# the watches that are actually due, instead of copying and scanning every watch every few seconds.
+#
+# A watch is taken out of the schedule when it is handed out by pop_due(), call schedule() again when the check
+# finishes (or when the interval/paused state of the watch changes) to put it back in.
+class WatchScheduler:
+
+    def __init__(self, datastore):
+        self.datastore = datastore
+        self.lock = threading.Lock()
+        self.heap = []
+        # uuid: due time of the current heap entry, heap entries that don't match this are stale and skipped
+        self.due = {}
+
+    def next_check_time(self, watch):
+        # If they supplied an individual entry minutes to threshold.
+        if watch.get("minutes_between_check") is not None:
+            max_time = int(watch["minutes_between_check"])
+        else:
+            # Default system wide.
+            max_time = int(self.datastore.data["settings"]["requests"]["minutes_between_check"])
+
+        return watch["last_checked"] + max_time
+
+    def __push(self, uuid, watch):
+        if watch is None or watch["paused"]:
+            self.due.pop(uuid, None)
+            return
+
+        due = self.next_check_time(watch)
+        self.due[uuid] = due
+        heapq.heappush(self.heap, (due, uuid))
+
+    # (Re)schedule one watch from its current last_checked/interval/paused state
+    def schedule(self, uuid):
+        with self.lock:
+            self.__push(uuid, self.datastore.data["watching"].get(uuid))
+
+    # Rebuild everything, for when the global default interval changes
+    def schedule_all(self):
+        with self.lock:
+            self.heap = []
+            self.due = {}
+            for uuid, watch in self.datastore.data["watching"].items():
+                if not watch["paused"]:
+                    self.due[uuid] = self.next_check_time(watch)
+
+            self.heap = [(due, uuid) for uuid, due in self.due.items()]
+            heapq.heapify(self.heap)
+
+    # Returns the UUIDs that are due now
+    def pop_due(self, now=None):
+        if now is None:
+            now = time.time()
+
+        due_uuids = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                due, uuid = heapq.heappop(self.heap)
+                if self.due.get(uuid) != due:
+                    continue
+                del self.due[uuid]
+
+                # The watch could have been deleted, paused or checked since it was scheduled
+                watch = self.datastore.data["watching"].get(uuid)
+                if watch is None or watch["paused"]:
+                    continue
+
+                if self.next_check_time(watch) > now:
+                    self.__push(uuid, watch)
+                    continue
+
+                due_uuids.append(uuid)
+
+        return due_uuids
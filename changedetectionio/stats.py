@@ -0,0 +1,16 @@
+import threading
+from collections import Counter
+
+# Counters shown in /api/stats, only for this process (remote workers and filter processes keep their own)
+lock = threading.Lock()
+counters = Counter()
+
+
+def increment(name, amount=1):
+    with lock:
+        counters[name] += amount
+
+
+def get_counters():
+    with lock:
+        return dict(counters)
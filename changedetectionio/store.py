@@ -9,6 +9,7 @@ import time
 import threading
 import os
 
+from changedetectionio.history import HistoryIndex
 from changedetectionio.notification import (
     default_notification_format,
     default_notification_body,
@@ -20,12 +21,17 @@ from changedetectionio.notification import (
 # https://stackoverflow.com/questions/6190468/how-to-trigger-function-on-value-change
 class ChangeDetectionStore:
     lock = Lock()
+    # Only one save at a time, so an older snapshot can never be written over a newer one
+    write_lock = Lock()
+    history_lock = Lock()
 
     def __init__(
         self,
         datastore_path="/datastore",
         include_default_watches=True,
         version_tag="0.0.0",
+        datastore_backend=None,
+        checkpoint_minutes=None,
     ):
         # Should only be active for docker
         # logging.basicConfig(filename='/dev/stdout', level=logging.INFO)
@@ -34,6 +40,40 @@ class ChangeDetectionStore:
         self.json_store_path = "{}/url-watches.json".format(self.datastore_path)
         self.stop_thread = False
 
+        # "json" (default) rewrites url-watches.json, "sqlite" only writes the watches that changed
+        self.datastore_backend = datastore_backend or os.getenv("DATASTORE_BACKEND", "json")
+        self.sqlite_store = None
+        if self.datastore_backend == "sqlite":
+            from changedetectionio.store_sqlite import SQLiteStore
+
+            self.sqlite_store = SQLiteStore("{}/url-watches.db".format(self.datastore_path))
+
+        # UUIDs of watches that changed or were removed since the last save
+        self.__dirty_watches = set()
+        self.__deleted_watches = set()
+
+        # UUIDs of watches with a snapshot newer than last_viewed, kept up to date as watches change
+        self.__unviewed_watches = set()
+
+        # uuid: HistoryIndex, built on first use
+        self.__history_index = {}
+
+        # Re #152, Return env base_url if not overriden, @todo also prefer the proxy pass url
+        self.__env_base_url = os.getenv("BASE_URL", "").strip('" ')
+
+        # With the JSON backend, changes go to an append-only journal and url-watches.json is only
+        # rewritten every few minutes, set DATASTORE_CHECKPOINT_MINUTES=0 to rewrite it every minute instead.
+        if checkpoint_minutes is None:
+            checkpoint_minutes = int(os.getenv("DATASTORE_CHECKPOINT_MINUTES", 10))
+        self.checkpoint_minutes = checkpoint_minutes
+        self.journal = None
+        # The settings and other non-watch data as they were last journalled, JSON encoded
+        self.__journalled_meta = None
+        if not self.sqlite_store and self.checkpoint_minutes > 0:
+            from changedetectionio.store_journal import WatchJournal
+
+            self.journal = WatchJournal("{}/url-watches.journal".format(self.datastore_path))
+
         self.__data = {
             "note": "Hello! If you change this file manually, please be sure to restart your changedetection.io instance!",
             "watching": {},
@@ -41,13 +81,23 @@ class ChangeDetectionStore:
                 "headers": {
                     "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/87.0.4280.66 Safari/537.36",
                     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9",
-                    "Accept-Encoding": "gzip, deflate",  # No support for brolti in python requests yet.
+                    "Accept-Encoding": "gzip, deflate, br, zstd",  # br/zstd are only sent when their decoder is installed
                     "Accept-Language": "en-GB,en-US;q=0.9,en;",
                 },
                 "requests": {
                     "timeout": 15,  # Default 15 seconds
                     "minutes_between_check": 10800,  # Default 3 hours
-                    "workers": 10,  # Number of threads, lower is better for slow connections
+                    "workers": 10,  # Maximum number of threads, lower is better for slow connections
+                    "workers_min": 2,  # The pool shrinks down to this many threads when there is not much to do
+                    "pool_maxsize": 10,  # Connections kept open per site
+                    "pool_idle_timeout": 300,  # Seconds before the connections to a site that isn't used anymore are closed
+                    "filter_processes": 0,  # Processes for parsing/filtering the fetched content, 0 = in the worker thread
+                    "interactive_burst": 10,  # Recheck/edit jobs handed out before letting one scheduled job through, 0 = no limit
+                    "max_body_size_mb": 50,  # Pages are cut off after this many MB, 0 = no limit
+                    "webdriver_sessions": 2,  # WebDriver sessions kept open for html_webdriver watches
+                    "webdriver_session_max_uses": 50,  # A WebDriver session is restarted after this many checks
+                    "webdriver_max_wait": 10,  # Seconds to wait for a Javascript page to finish before using it as it is
+                    "html_parser": "html.parser",  # Parser for CSS filters, 'lxml' is faster on big pages but can give different text
                 },
                 "application": {
                     "password": False,
@@ -84,7 +134,17 @@ class ChangeDetectionStore:
             # Re #110, so then if this is set to None, we know to use the default value instead
             # Requires setting to None on submit if it's the same as the default
             "minutes_between_check": None,
+            "max_body_size_mb": None,  # None to use the global setting
+            "webdriver_wait_for": "",  # CSS selector to wait for with the WebDriver fetcher, or wait for the DOM to settle
+            "webdriver_max_wait": None,  # Seconds, None to use the global setting
             "previous_md5": "",
+            # From the last response, sent back as If-None-Match/If-Modified-Since so an unchanged page is a 304
+            "etag": None,
+            "last_modified": None,
+            # md5 of the fetched body and the filter settings, when neither changed the page is not processed again
+            "previous_raw_md5": "",
+            "encoding": None,  # Character encoding the last response was decoded with
+            "check_timings": {},  # Seconds spent in each step of processing the last fetched page
             "uuid": str(uuid_builder.uuid4()),
             "headers": {},  # Extra headers to send
             "history": {},  # Dict of timestamp and output stripped filename
@@ -107,48 +167,27 @@ class ChangeDetectionStore:
                 self.__data["build_sha"] = f.read()
 
         try:
-            # @todo retest with ", encoding='utf-8'"
-            with open(self.json_store_path) as json_file:
-                from_disk = json.load(json_file)
-
-                # @todo isnt there a way todo this dict.update recursively?
-                # Problem here is if the one on the disk is missing a sub-struct, it wont be present anymore.
-                if "watching" in from_disk:
-                    self.__data["watching"].update(from_disk["watching"])
-
-                if "app_guid" in from_disk:
-                    self.__data["app_guid"] = from_disk["app_guid"]
-
-                if "settings" in from_disk:
-                    if "headers" in from_disk["settings"]:
-                        self.__data["settings"]["headers"].update(
-                            from_disk["settings"]["headers"]
-                        )
-
-                    if "requests" in from_disk["settings"]:
-                        self.__data["settings"]["requests"].update(
-                            from_disk["settings"]["requests"]
-                        )
-
-                    if "application" in from_disk["settings"]:
-                        self.__data["settings"]["application"].update(
-                            from_disk["settings"]["application"]
-                        )
-
-                # Reinitialise each `watching` with our generic_definition in the case that we add a new var in the future.
-                # @todo pretty sure theres a python we todo this with an abstracted(?) object!
-                for uuid, watch in self.__data["watching"].items():
-                    _blank = deepcopy(self.generic_definition)
-                    _blank.update(watch)
-                    self.__data["watching"].update({uuid: _blank})
-                    self.__data["watching"][uuid][
-                        "newest_history_key"
-                    ] = self.get_newest_history_key(uuid)
-                    print("Watching:", uuid, self.__data["watching"][uuid]["url"])
+            from_disk = self.load_from_disk()
+
+            # @todo isnt there a way todo this dict.update recursively?
+            # Problem here is if the one on the disk is missing a sub-struct, it wont be present anymore.
+            if "watching" in from_disk:
+                self.__data["watching"].update(from_disk["watching"])
+
+            self.__merge_settings(from_disk)
+
+            # Reinitialise each `watching` with our generic_definition in the case that we add a new var in the future.
+            # @todo pretty sure theres a python we todo this with an abstracted(?) object!
+            for uuid, watch in self.__data["watching"].items():
+                _blank = deepcopy(self.generic_definition)
+                _blank.update(watch)
+                self.__data["watching"].update({uuid: _blank})
+                print("Watching:", uuid, self.__data["watching"][uuid]["url"])
 
         # First time ran, doesnt exist.
         except (FileNotFoundError, json.decoder.JSONDecodeError):
-            if include_default_watches:
+            # Not the first time if there's a journal, the changes since the last url-watches.json are in there
+            if include_default_watches and not (self.journal and self.journal.has_records()):
                 print("Creating JSON store at", self.datastore_path)
 
                 self.add_watch(
@@ -158,6 +197,12 @@ class ChangeDetectionStore:
                 self.add_watch(url="https://www.gov.uk/coronavirus", tag="Covid")
                 self.add_watch(url="https://changedetection.io", tag="Tech news")
 
+        if self.journal:
+            self.replay_journal()
+
+        for uuid in self.__data["watching"]:
+            self.__refresh_derived_fields(uuid)
+
         self.__data["version_tag"] = version_tag
 
         # Helper to remove password protection
@@ -168,7 +213,6 @@ class ChangeDetectionStore:
 
         if not "app_guid" in self.__data:
             import sys
-            import os
 
             if "pytest" in sys.modules or "PYTEST_CURRENT_TEST" in os.environ:
                 self.__data["app_guid"] = "test-" + str(uuid_builder.uuid4())
@@ -187,25 +231,165 @@ class ChangeDetectionStore:
         # Finally start the thread that will manage periodic data saves to JSON
         save_data_thread = threading.Thread(target=self.save_datastore).start()
 
+    def load_from_disk(self):
+        if self.sqlite_store:
+            try:
+                return self.sqlite_store.load()
+            except FileNotFoundError:
+                pass
+
+        # @todo retest with ", encoding='utf-8'"
+        with open(self.json_store_path) as json_file:
+            from_disk = json.load(json_file)
+
+        # Migrating from url-watches.json, the first save will write every watch into the database
+        # url-watches.json is left as-is, it is no longer read once the database has data.
+        if self.sqlite_store:
+            print("Migrating", self.json_store_path, "to SQLite")
+            self.__dirty_watches.update(from_disk.get("watching", {}).keys())
+
+        return from_disk
+
+    def __merge_settings(self, from_disk):
+        if "app_guid" in from_disk:
+            self.__data["app_guid"] = from_disk["app_guid"]
+
+        if "settings" in from_disk:
+            if "headers" in from_disk["settings"]:
+                default_accept_encoding = self.__data["settings"]["headers"]["Accept-Encoding"]
+                self.__data["settings"]["headers"].update(
+                    from_disk["settings"]["headers"]
+                )
+                # The old default, from before brotli/zstd could be decoded
+                if self.__data["settings"]["headers"].get("Accept-Encoding") == "gzip, deflate":
+                    self.__data["settings"]["headers"]["Accept-Encoding"] = default_accept_encoding
+
+            if "requests" in from_disk["settings"]:
+                self.__data["settings"]["requests"].update(
+                    from_disk["settings"]["requests"]
+                )
+
+            if "application" in from_disk["settings"]:
+                self.__data["settings"]["application"].update(
+                    from_disk["settings"]["application"]
+                )
+
+    # Apply the changes recorded since url-watches.json was last written
+    def replay_journal(self):
+        count = 0
+        for record in self.journal.replay():
+            uuid = record.get("uuid")
+
+            if record["op"] == "meta":
+                self.__merge_settings(record["data"])
+
+            elif record["op"] == "put":
+                _blank = deepcopy(self.generic_definition)
+                _blank.update(record["data"])
+                self.__data["watching"][uuid] = _blank
+                self.__history_index.pop(uuid, None)
+
+            elif record["op"] == "update" and uuid in self.__data["watching"]:
+                self.__apply_update(uuid, record["data"])
+
+            elif record["op"] == "delete":
+                if uuid == "all":
+                    self.__data["watching"] = {}
+                else:
+                    self.__data["watching"].pop(uuid, None)
+                    self.__history_index.pop(uuid, None)
+            count += 1
+
+        print("Replayed", count, "changes from", self.journal.journal_path)
+
+    def __watch_changed(self, uuid):
+        self.__refresh_derived_fields(uuid)
+        self.__dirty_watches.add(uuid)
+        self.needs_write = True
+
+    # These fields are worked out from the other fields of the watch, they are updated here whenever
+    # the watch changes instead of recalculating every watch on every access to .data
+    def __refresh_derived_fields(self, uuid):
+        watch = self.__data["watching"][uuid]
+        watch["newest_history_key"] = self.get_newest_history_key(uuid)
+
+        if int(watch["newest_history_key"]) <= int(watch["last_viewed"]):
+            watch["viewed"] = True
+            self.__unviewed_watches.discard(uuid)
+        else:
+            watch["viewed"] = False
+            self.__unviewed_watches.add(uuid)
+
+        # #106 - Be sure this is None on empty string, False, None, etc
+        # Default var for fetch_backend
+        if not watch["fetch_backend"]:
+            watch["fetch_backend"] = self.__data["settings"]["application"]["fetch_backend"]
+
+    # Anything that changes a watch outside of the methods here should call this so it gets saved
+    def mark_watch_dirty(self, uuid):
+        # The history could have been changed too, rebuild the index next time it's needed
+        with self.history_lock:
+            self.__history_index.pop(uuid, None)
+
+        if self.journal:
+            with self.lock:
+                self.journal.append(
+                    {"op": "put", "uuid": uuid, "data": self.__data["watching"][uuid]}
+                )
+
+        self.__watch_changed(uuid)
+
+    # Sorted index of watch['history'], use this instead of sorting the history keys
+    def get_history_index(self, uuid):
+        with self.history_lock:
+            index = self.__history_index.get(uuid)
+            if index is None:
+                index = HistoryIndex(self.__data["watching"][uuid]["history"].keys())
+                self.__history_index[uuid] = index
+
+        return index
+
     # Returns the newest key, but if theres only 1 record, then it's counted as not being new, so return 0.
     def get_newest_history_key(self, uuid):
-        if len(self.__data["watching"][uuid]["history"]) == 1:
+        index = self.get_history_index(uuid)
+        if len(index) == 1:
             return 0
 
-        dates = list(self.__data["watching"][uuid]["history"].keys())
-        # Convert to int, sort and back to str again
-        # @todo replace datastore getter that does this automatically
-        dates = [int(i) for i in dates]
-        dates.sort(reverse=True)
-        if len(dates):
-            # always keyed as str
-            return str(dates[0])
-
-        return 0
+        # always keyed as str
+        return index.newest() or 0
 
     def set_last_viewed(self, uuid, timestamp):
-        self.data["watching"][uuid].update({"last_viewed": int(timestamp)})
-        self.needs_write = True
+        with self.lock:
+            if self.journal:
+                self.journal.append(
+                    {"op": "update", "uuid": uuid, "data": {"last_viewed": int(timestamp)}}
+                )
+            self.data["watching"][uuid].update({"last_viewed": int(timestamp)})
+
+        self.__watch_changed(uuid)
+
+    def __apply_update(self, uuid, update_obj):
+        # The history and its index change together, get_history_index() must never build an index
+        # from a history that is missing keys which were already added to the index (or the other way around)
+        if update_obj and "history" in update_obj:
+            new_history = update_obj.pop("history")
+            with self.history_lock:
+                self.__data["watching"][uuid]["history"].update(new_history)
+                # Not built yet, it will be built from the whole history when it's needed
+                if uuid in self.__history_index:
+                    for key in new_history:
+                        self.__history_index[uuid].add(key)
+
+        # In python 3.9 we have the |= dict operator, but that still will lose data on nested structures...
+        for dict_key, d in self.generic_definition.items():
+            if isinstance(d, dict):
+                if update_obj is not None and dict_key in update_obj:
+                    self.__data["watching"][uuid][dict_key].update(
+                        update_obj[dict_key]
+                    )
+                    del update_obj[dict_key]
+
+        self.__data["watching"][uuid].update(update_obj)
 
     def update_watch(self, uuid, update_obj):
 
@@ -214,52 +398,21 @@ class ChangeDetectionStore:
             return
 
         with self.lock:
+            # Only the changed fields are journalled, not the whole watch
+            if self.journal:
+                self.journal.append({"op": "update", "uuid": uuid, "data": update_obj})
 
-            # In python 3.9 we have the |= dict operator, but that still will lose data on nested structures...
-            for dict_key, d in self.generic_definition.items():
-                if isinstance(d, dict):
-                    if update_obj is not None and dict_key in update_obj:
-                        self.__data["watching"][uuid][dict_key].update(
-                            update_obj[dict_key]
-                        )
-                        del update_obj[dict_key]
-
-            self.__data["watching"][uuid].update(update_obj)
-            self.__data["watching"][uuid][
-                "newest_history_key"
-            ] = self.get_newest_history_key(uuid)
+            self.__apply_update(uuid, update_obj)
 
-        self.needs_write = True
+        self.__watch_changed(uuid)
 
+    # Per-watch fields like 'viewed' and 'newest_history_key' are kept up to date by __refresh_derived_fields()
     @property
     def data(self):
-        has_unviewed = False
-        for uuid, v in self.__data["watching"].items():
-            self.__data["watching"][uuid][
-                "newest_history_key"
-            ] = self.get_newest_history_key(uuid)
-            if int(v["newest_history_key"]) <= int(v["last_viewed"]):
-                self.__data["watching"][uuid]["viewed"] = True
-
-            else:
-                self.__data["watching"][uuid]["viewed"] = False
-                has_unviewed = True
-
-            # #106 - Be sure this is None on empty string, False, None, etc
-            # Default var for fetch_backend
-            if not self.__data["watching"][uuid]["fetch_backend"]:
-                self.__data["watching"][uuid]["fetch_backend"] = self.__data[
-                    "settings"
-                ]["application"]["fetch_backend"]
-
-        # Re #152, Return env base_url if not overriden, @todo also prefer the proxy pass url
-        env_base_url = os.getenv("BASE_URL", "")
         if not self.__data["settings"]["application"]["base_url"]:
-            self.__data["settings"]["application"]["base_url"] = env_base_url.strip(
-                '" '
-            )
+            self.__data["settings"]["application"]["base_url"] = self.__env_base_url
 
-        self.__data["has_unviewed"] = has_unviewed
+        self.__data["has_unviewed"] = len(self.__unviewed_watches) > 0
 
         return self.__data
 
@@ -285,7 +438,14 @@ class ChangeDetectionStore:
     # Delete a single watch by UUID
     def delete(self, uuid):
         with self.lock:
+            if self.journal:
+                self.journal.append({"op": "delete", "uuid": uuid})
+
             if uuid == "all":
+                self.__deleted_watches.update(self.__data["watching"].keys())
+                self.__dirty_watches.clear()
+                self.__unviewed_watches.clear()
+                self.__history_index = {}
                 self.__data["watching"] = {}
 
                 # GitHub #30 also delete history records
@@ -298,6 +458,10 @@ class ChangeDetectionStore:
                     self.unlink_history_file(path)
 
                 del self.data["watching"][uuid]
+                self.__deleted_watches.add(uuid)
+                self.__dirty_watches.discard(uuid)
+                self.__unviewed_watches.discard(uuid)
+                self.__history_index.pop(uuid, None)
 
             self.needs_write = True
 
@@ -344,8 +508,11 @@ class ChangeDetectionStore:
                     self.data["watching"][uuid]["last_changed"] = 0
                     self.data["watching"][uuid]["previous_md5"] = 0
 
+        history_index = self.get_history_index(uuid)
         for timestamp in del_timestamps:
-            del self.data["watching"][uuid]["history"][str(timestamp)]
+            with self.history_lock:
+                del self.data["watching"][uuid]["history"][str(timestamp)]
+                history_index.remove(timestamp)
 
             # If there was a limitstamp, we need to reset some meta data about the entry
             # This has to happen after we remove the others from the list
@@ -368,7 +535,12 @@ class ChangeDetectionStore:
                         self.data["watching"][uuid]["previous_md5"] = False
                         pass
 
-        self.needs_write = True
+        # previous_md5 changed, so the next check has to get and process the whole page again
+        self.data["watching"][uuid]["etag"] = None
+        self.data["watching"][uuid]["last_modified"] = None
+        self.data["watching"][uuid]["previous_raw_md5"] = ""
+
+        self.mark_watch_dirty(uuid)
         return changes_removed
 
     def add_watch(self, url, tag, extras=None):
@@ -390,6 +562,11 @@ class ChangeDetectionStore:
                 "last_changed",
                 "newest_history_key",
                 "previous_md5",
+                "etag",
+                "last_modified",
+                "previous_raw_md5",
+                "encoding",
+                "check_timings",
                 "viewed",
             ]:
                 if k in apply_extras:
@@ -398,6 +575,12 @@ class ChangeDetectionStore:
             _blank.update(apply_extras)
 
             self.data["watching"][new_uuid] = _blank
+            self.__history_index[new_uuid] = HistoryIndex()
+            self.__refresh_derived_fields(new_uuid)
+            self.__dirty_watches.add(new_uuid)
+
+            if self.journal:
+                self.journal.append({"op": "put", "uuid": new_uuid, "data": _blank})
 
         # Get the directory ready
         output_path = "{}/{}".format(self.datastore_path, new_uuid)
@@ -406,7 +589,7 @@ class ChangeDetectionStore:
         except FileExistsError:
             print(output_path, "already exists.")
 
-        self.sync_to_json()
+        self.sync_to_disk()
         return new_uuid
 
     # Save some text file to the appropriate path and bump the history
@@ -422,20 +605,84 @@ class ChangeDetectionStore:
 
         return fname
 
+    # checkpoint=True also folds the journal into url-watches.json straight away
+    def sync_to_disk(self, checkpoint=False):
+        if self.sqlite_store:
+            self.sync_to_sqlite()
+        elif self.journal and not checkpoint:
+            self.sync_to_journal()
+        else:
+            self.sync_to_json()
+
+    # Watch changes are journalled as they happen, this adds the settings and other non-watch data
+    # but only when they changed since the last time, not on every save
+    def sync_to_journal(self):
+        with self.lock:
+            self.needs_write = False
+            self.__dirty_watches.clear()
+            self.__deleted_watches.clear()
+
+            # 'has_unviewed' is worked out again from the watches
+            meta = {k: v for k, v in self.__data.items() if k not in ["watching", "has_unviewed"]}
+            encoded = json.dumps(meta, sort_keys=True)
+            if encoded != self.__journalled_meta:
+                self.journal.append({"op": "meta", "data": meta})
+                self.__journalled_meta = encoded
+
+    def sync_to_sqlite(self):
+        logging.info("Saving to SQLite..")
+
+        with self.write_lock:
+            with self.lock:
+                dirty = self.__dirty_watches
+                deleted = self.__deleted_watches
+                self.__dirty_watches = set()
+                self.__deleted_watches = set()
+                self.needs_write = False
+
+                # Only the changed watches are serialised, not the whole datastore
+                watches = {}
+                for uuid in dirty:
+                    if uuid in self.__data["watching"]:
+                        watches[uuid] = json.dumps(self.__data["watching"][uuid])
+
+                meta = deepcopy({k: v for k, v in self.__data.items() if k != "watching"})
+
+            try:
+                self.sqlite_store.write(meta=meta, watches=watches, deleted=deleted)
+            except Exception as e:
+                logging.error("Error writing to SQLite!! (will retry on the next save) : %s", str(e))
+                with self.lock:
+                    self.__dirty_watches.update(dirty - self.__deleted_watches)
+                    self.__deleted_watches.update(deleted)
+                    self.needs_write = True
+
     def sync_to_json(self):
         logging.info("Saving JSON..")
 
-        try:
-            data = deepcopy(self.__data)
-        except RuntimeError as e:
-            # Try again in 15 seconds
-            time.sleep(15)
-            logging.error(
-                "! Data changed when writing to JSON, trying again.. %s", str(e)
-            )
-            self.sync_to_json()
-            return
-        else:
+        # One checkpoint at a time (the save thread and a backup/shutdown from the UI), two of them could
+        # rotate the journal and remove the rotated records while the other one hasn't written them yet
+        with self.write_lock:
+            while True:
+                # The whole file is rewritten, so everything pending is included
+                with self.lock:
+                    self.__dirty_watches.clear()
+                    self.__deleted_watches.clear()
+                    # New changes go to a fresh journal while this one is folded into url-watches.json
+                    if self.journal:
+                        self.journal.rotate()
+
+                try:
+                    data = deepcopy(self.__data)
+                except RuntimeError as e:
+                    # Try again in 15 seconds
+                    logging.error(
+                        "! Data changed when writing to JSON, trying again.. %s", str(e)
+                    )
+                    time.sleep(15)
+                    continue
+
+                break
 
             try:
                 # Re #286  - First write to a temp file, then confirm it looks OK and rename it
@@ -452,20 +699,37 @@ class ChangeDetectionStore:
 
             else:
                 os.rename(self.json_store_path + ".tmp", self.json_store_path)
+                if self.journal:
+                    self.journal.remove_rotated()
 
             self.needs_write = False
 
     # Thread runner, this helps with thread/write issues when there are many operations that want to update the JSON
     # by just running periodically in one thread, according to python, dict updates are threadsafe.
     def save_datastore(self):
+        last_checkpoint = time.time()
 
         while True:
             if self.stop_thread:
                 print("Shutting down datastore thread")
                 return
 
+            if self.journal:
+                # Only fold the journal into url-watches.json every few minutes
+                if (
+                    time.time() - last_checkpoint >= self.checkpoint_minutes * 60
+                    and self.journal.has_records()
+                ):
+                    self.sync_to_json()
+                    last_checkpoint = time.time()
+                elif self.needs_write:
+                    self.sync_to_disk()
+
+                time.sleep(2)
+                continue
+
             if self.needs_write:
-                self.sync_to_json()
+                self.sync_to_disk()
 
             # Once per minute is enough, more and it can cause high CPU usage
             # better here is to use something like self.app.config.exit.wait(1), but we cant get to 'app' from here
@@ -0,0 +1,53 @@
+import json
+import logging
+import os
+
+
+# Append-only log of watch changes, written between the (much less frequent) full url-watches.json saves
+# One JSON record per line, on startup these are replayed on top of the last url-watches.json
+class WatchJournal:
+
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        # Records that were already being folded into url-watches.json when we stopped
+        self.rotated_path = journal_path + ".old"
+
+    def append(self, record):
+        with open(self.journal_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def has_records(self):
+        return os.path.isfile(self.journal_path) or os.path.isfile(self.rotated_path)
+
+    # Move the current journal aside, new records go to a fresh file while url-watches.json is written
+    def rotate(self):
+        if not os.path.isfile(self.journal_path):
+            return
+
+        # The last url-watches.json save didn't finish, keep those records too
+        if os.path.isfile(self.rotated_path):
+            with open(self.journal_path) as new, open(self.rotated_path, "a") as rotated:
+                rotated.write(new.read())
+            os.unlink(self.journal_path)
+        else:
+            os.replace(self.journal_path, self.rotated_path)
+
+    # url-watches.json now contains everything that was in the rotated journal
+    def remove_rotated(self):
+        try:
+            os.unlink(self.rotated_path)
+        except FileNotFoundError:
+            pass
+
+    def replay(self):
+        for path in [self.rotated_path, self.journal_path]:
+            try:
+                with open(path) as f:
+                    for line in f:
+                        try:
+                            yield json.loads(line)
+                        except json.decoder.JSONDecodeError:
+                            # Half written last line from a crash, the rest is still good
+                            logging.error("Skipping unreadable record in %s", path)
+            except FileNotFoundError:
+                continue
@@ -0,0 +1,51 @@
+import json
+import sqlite3
+from contextlib import closing
+
+
+# Optional storage for ChangeDetectionStore, enable with DATASTORE_BACKEND=sqlite
+# Each watch is its own row, so a save only has to touch the watches that changed instead of
+# serialising the whole datastore back into url-watches.json every time.
+class SQLiteStore:
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+        with closing(self.connect()) as conn:
+            with conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS watches (uuid TEXT PRIMARY KEY, data TEXT NOT NULL)")
+                # Everything that is not a watch (settings, app_guid etc) is kept as one small JSON blob
+                conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, data TEXT NOT NULL)")
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        # WAL lets the web UI keep reading while the datastore thread is writing
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    # Returns the same structure as url-watches.json would give us
+    def load(self):
+        with closing(self.connect()) as conn:
+            row = conn.execute("SELECT data FROM meta WHERE key = 'datastore'").fetchone()
+
+            # Nothing saved yet, treat it the same as a missing url-watches.json
+            if not row:
+                raise FileNotFoundError(self.db_path)
+
+            from_disk = json.loads(row[0])
+            from_disk['watching'] = {}
+            for uuid, data in conn.execute("SELECT uuid, data FROM watches"):
+                from_disk['watching'][uuid] = json.loads(data)
+
+        return from_disk
+
+    # meta: dict of everything except 'watching'
+    # watches: dict of uuid and the already serialised JSON of the watch
+    # deleted: list of uuids to remove
+    def write(self, meta, watches, deleted):
+        with closing(self.connect()) as conn:
+            # One transaction per flush, if anything fails nothing is written
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO meta (key, data) VALUES ('datastore', ?)", (json.dumps(meta),))
+                conn.executemany("INSERT OR REPLACE INTO watches (uuid, data) VALUES (?, ?)", watches.items())
+                conn.executemany("DELETE FROM watches WHERE uuid = ?", [(uuid,) for uuid in deleted])
@@ -1,7 +1,7 @@
 #!/usr/bin/python3
 
 import pytest
-from changedetectionio import changedetection_app
+from changedetectionio import changedetection_app, stop_threads
 from changedetectionio import store
 import os
 
@@ -16,6 +16,9 @@ def cleanup(datastore_path):
     # Unlink test output files
     files = ['output.txt',
              'url-watches.json',
+             'url-watches.db',
+             'url-watches.journal',
+             'url-watches.journal.old',
              'notification.txt',
              'count.txt',
              'endpoint-content.txt']
@@ -45,7 +48,7 @@ def app(request):
 
     def teardown():
         datastore.stop_thread = True
-        app.config.exit.set()
+        stop_threads()
         cleanup(app_config['datastore_path'])
 
        
@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+
+import time
+from flask import url_for
+from . util import set_original_response, set_modified_response, live_server_setup
+
+sleep_time_for_fetch_thread = 3
+
+
+def get_not_modified_count():
+    try:
+        with open("test-datastore/count.txt", "r") as f:
+            return int(f.read())
+    except FileNotFoundError:
+        return 0
+
+
+def test_conditional_get(client, live_server):
+    import changedetectionio
+
+    set_original_response()
+
+    # Like /test-endpoint, but with an ETag, and it counts the 304's it sends
+    @live_server.app.route('/test-etag-endpoint')
+    def test_etag_endpoint():
+        from flask import request, make_response
+        import hashlib
+
+        with open("test-datastore/endpoint-content.txt", "r") as f:
+            content = f.read()
+
+        etag = '"{}"'.format(hashlib.md5(content.encode('utf-8')).hexdigest())
+        if request.headers.get('If-None-Match') == etag:
+            count = get_not_modified_count() + 1
+            with open("test-datastore/count.txt", "w") as f:
+                f.write(str(count))
+            return "", 304
+
+        resp = make_response(content)
+        resp.headers['ETag'] = etag
+        return resp
+
+    live_server_setup(live_server)
+
+    res = client.post(
+        url_for("import_page"),
+        data={"urls": url_for('test_etag_endpoint', _external=True)},
+        follow_redirects=True
+    )
+    assert b"1 Imported" in res.data
+    time.sleep(sleep_time_for_fetch_thread)
+
+    datastore = changedetectionio.datastore
+    uuid = list(datastore.data['watching'].keys()).pop()
+    assert datastore.data['watching'][uuid]['etag']
+
+    # Nothing changed, the server only has to say so
+    last_checked = datastore.data['watching'][uuid]['last_checked']
+    time.sleep(1)
+    client.get(url_for("api_watch_checknow"), follow_redirects=True)
+    time.sleep(sleep_time_for_fetch_thread)
+    assert get_not_modified_count() == 1
+    assert datastore.data['watching'][uuid]['last_checked'] > last_checked
+    assert len(datastore.data['watching'][uuid]['history']) == 1
+
+    res = client.get(url_for("index"))
+    assert b'unviewed' not in res.data
+
+    # Changed content gets a new ETag and is processed as normal
+    set_modified_response()
+    client.get(url_for("api_watch_checknow"), follow_redirects=True)
+    time.sleep(sleep_time_for_fetch_thread)
+    assert get_not_modified_count() == 1
+    assert len(datastore.data['watching'][uuid]['history']) == 2
+
+    res = client.get(url_for("index"))
+    assert b'unviewed' in res.data
+
+    # Editing the watch forgets the ETag, so the new settings are applied to the whole page again
+    res = client.post(
+        url_for("edit_page", uuid="first"),
+        data={"css_filter": "body", "url": url_for('test_etag_endpoint', _external=True), "tag": "", "headers": "",
+              'fetch_backend': "html_requests"},
+        follow_redirects=True
+    )
+    assert b"Updated watch." in res.data
+    time.sleep(sleep_time_for_fetch_thread)
+    assert get_not_modified_count() == 1
+    assert datastore.data['watching'][uuid]['etag']
@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+
+import time
+import pytest
+from flask import url_for
+from . util import set_original_response, live_server_setup
+
+sleep_time_for_fetch_thread = 3
+
+
+def test_brotli_content_encoding(client, live_server):
+    import changedetectionio
+    brotli = pytest.importorskip("brotli")
+
+    set_original_response()
+
+    # Like /test-endpoint, but brotli compressed when the client asks for it
+    @live_server.app.route('/test-brotli-endpoint')
+    def test_brotli_endpoint():
+        from flask import request, make_response
+
+        with open("test-datastore/endpoint-content.txt", "r") as f:
+            content = f.read() + "<p>Padding that compresses well</p>\n" * 200
+
+        if 'br' not in request.headers.get('Accept-Encoding', ''):
+            return content
+
+        resp = make_response(brotli.compress(content.encode('utf-8')))
+        resp.headers['Content-Encoding'] = 'br'
+        resp.headers['Content-Type'] = 'text/html; charset=utf-8'
+        return resp
+
+    live_server_setup(live_server)
+
+    res = client.post(
+        url_for("import_page"),
+        data={"urls": url_for('test_brotli_endpoint', _external=True)},
+        follow_redirects=True
+    )
+    assert b"1 Imported" in res.data
+    time.sleep(sleep_time_for_fetch_thread)
+
+    datastore = changedetectionio.datastore
+    uuid = list(datastore.data['watching'].keys()).pop()
+    assert not datastore.data['watching'][uuid]['last_error']
+
+    res = client.get(url_for("preview_page", uuid="first"), follow_redirects=True)
+    assert b'Which is across multiple lines' in res.data
+
+    # Much less came over the network than what it decoded to
+    counters = client.get(url_for("api_stats")).get_json()['counters']
+    assert counters['bytes_received_br'] * 5 < counters['bytes_decoded_br']
@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+
+import time
+from flask import url_for
+from . util import live_server_setup
+
+sleep_time_for_fetch_thread = 3
+
+
+def test_max_body_size(client, live_server):
+    import changedetectionio
+
+    live_server_setup(live_server)
+
+    # Bit over 1MB
+    with open("test-datastore/endpoint-content.txt", "w") as f:
+        f.write("<html><body>\n" + "<p>Some line of text that goes on for a while</p>\n" * 25000 + "<p>The end</p></body></html>")
+
+    res = client.post(
+        url_for("import_page"),
+        data={"urls": url_for('test_endpoint', _external=True)},
+        follow_redirects=True
+    )
+    assert b"1 Imported" in res.data
+    time.sleep(sleep_time_for_fetch_thread)
+
+    # Under the global limit, all of it is checked
+    datastore = changedetectionio.datastore
+    uuid = list(datastore.data['watching'].keys()).pop()
+    assert not datastore.data['watching'][uuid]['last_error']
+
+    res = client.get(url_for("preview_page", uuid="first"), follow_redirects=True)
+    assert b'The end' in res.data
+
+    # This watch gets its own limit, smaller than the page
+    res = client.post(
+        url_for("edit_page", uuid="first"),
+        data={"max_body_size_mb": 1, "url": url_for('test_endpoint', _external=True), "tag": "", "headers": "",
+              'fetch_backend': "html_requests"},
+        follow_redirects=True
+    )
+    assert b"Updated watch." in res.data
+    time.sleep(sleep_time_for_fetch_thread)
+
+    assert datastore.data['watching'][uuid]['max_body_size_mb'] == 1
+    res = client.get(url_for("index"))
+    assert b'bigger than the 1 MB limit' in res.data
+
+    res = client.get(url_for("preview_page", uuid="first"), follow_redirects=True)
+    assert b'Some line of text' in res.data
+    assert b'The end' not in res.data
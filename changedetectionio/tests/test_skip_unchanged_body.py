@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+
+import time
+from flask import url_for
+from . util import set_original_response, set_modified_response, live_server_setup
+
+sleep_time_for_fetch_thread = 3
+
+
+def test_skip_unchanged_body(client, live_server):
+    set_original_response()
+    live_server_setup(live_server)
+
+    res = client.post(
+        url_for("import_page"),
+        data={"urls": url_for('test_endpoint', _external=True)},
+        follow_redirects=True
+    )
+    assert b"1 Imported" in res.data
+    time.sleep(sleep_time_for_fetch_thread)
+
+    # Same page, same filters, it's not processed again
+    client.get(url_for("api_watch_checknow"), follow_redirects=True)
+    time.sleep(sleep_time_for_fetch_thread)
+
+    stats = client.get(url_for("api_stats")).get_json()
+    assert stats['counters']['checks'] == 2
+    assert stats['counters']['checks_body_unchanged'] == 1
+    assert stats['skip_rate'] == 50.0
+
+    res = client.get(url_for("index"))
+    assert b'unviewed' not in res.data
+
+    # Different filter settings, the same page has to be processed again
+    res = client.post(
+        url_for("edit_page", uuid="first"),
+        data={"ignore_text": "Some initial text", "url": url_for('test_endpoint', _external=True), "tag": "",
+              "headers": "", 'fetch_backend': "html_requests"},
+        follow_redirects=True
+    )
+    assert b"Updated watch." in res.data
+    time.sleep(sleep_time_for_fetch_thread)
+
+    stats = client.get(url_for("api_stats")).get_json()
+    assert stats['counters']['checks'] == 3
+    assert stats['counters']['checks_body_unchanged'] == 1
+
+    # And a changed page is always processed
+    set_modified_response()
+    client.get(url_for("api_watch_checknow"), follow_redirects=True)
+    time.sleep(sleep_time_for_fetch_thread)
+
+    stats = client.get(url_for("api_stats")).get_json()
+    assert stats['counters']['checks_body_unchanged'] == 1
+
+    res = client.get(url_for("index"))
+    assert b'unviewed' in res.data
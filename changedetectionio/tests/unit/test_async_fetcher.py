@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+
+# run from dir above changedetectionio/ dir
+# python3 -m unittest changedetectionio.tests.unit.test_async_fetcher
+
+import http.server
+import logging
+import queue
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from changedetectionio import content_fetcher, store
+from changedetectionio.update_worker import update_worker
+from changedetectionio.work_queue import UniqueWorkQueue
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/slow"):
+            time.sleep(1)
+        body = "<html><body>Some text for {}</body></html>".format(self.path).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncFetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}".format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def test_concurrent_fetches(self):
+        def fetch(i):
+            fetcher = content_fetcher.html_async()
+            fetcher.run("{}/page-{}".format(self.url, i), 10, {})
+            return fetcher
+
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            fetchers = list(executor.map(fetch, range(50)))
+
+        for i, fetcher in enumerate(fetchers):
+            self.assertEqual(fetcher.get_last_status_code(), 200)
+            self.assertIn("Some text for /page-{}".format(i), fetcher.content)
+
+        self.assertTrue(content_fetcher.html_async().is_ready())
+
+    def test_stop_closes_session_and_loop(self):
+        fetcher = content_fetcher.html_async()
+        fetcher.run("{}/before".format(self.url), 10, {})
+        session = content_fetcher.async_session
+        loop = content_fetcher.async_loop
+
+        content_fetcher.stop_async_loop()
+        self.assertTrue(session.closed)
+        self.assertTrue(loop.is_closed())
+        self.assertIsNone(content_fetcher.async_session)
+
+        # Started again for the next check
+        fetcher.run("{}/after".format(self.url), 10, {})
+        self.assertIn("Some text for /after", fetcher.content)
+        content_fetcher.stop_async_loop()
+
+    def test_worker_doesnt_wait_for_the_fetch(self):
+        datastore = store.ChangeDetectionStore(datastore_path=tempfile.mkdtemp(), include_default_watches=False)
+        uuids = [datastore.add_watch(url="{}/slow-{}".format(self.url, i), tag="") for i in range(20)]
+        for uuid in uuids:
+            datastore.data['watching'][uuid]['fetch_backend'] = 'html_async'
+
+        app = SimpleNamespace(config=SimpleNamespace(exit=threading.Event()), logger=logging.getLogger("test"))
+        q = UniqueWorkQueue()
+        update_worker(q, queue.Queue(), app, datastore, daemon=True).start()
+
+        now = time.time()
+        for uuid in uuids:
+            q.put(uuid)
+
+        # One worker, 20 fetches of 1 second each
+        while any(not datastore.data['watching'][uuid]['last_checked'] for uuid in uuids) and time.time() - now < 15:
+            time.sleep(0.05)
+        self.assertLess(time.time() - now, 5)
+
+        for uuid in uuids:
+            watch = datastore.data['watching'][uuid]
+            self.assertFalse(watch['last_error'])
+            self.assertTrue(watch['previous_md5'])
+
+        # Marked done once the result was saved
+        deadline = time.time() + 5
+        while q.in_flight and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(q.in_flight)
+
+        app.config.exit.set()
+        datastore.stop_thread = True
+        content_fetcher.stop_async_loop()
+
+
+if __name__ == '__main__':
+    unittest.main()
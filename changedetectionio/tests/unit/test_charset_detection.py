@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+
+# run from dir above changedetectionio/ dir
+# python3 -m unittest changedetectionio.tests.unit.test_charset_detection
+
+import codecs
+import unittest
+
+from changedetectionio import charset_detection
+
+
+class TestCharsetDetection(unittest.TestCase):
+
+    text = "<html><body><p>Grüße aus Köln, 10 €</p></body></html>"
+
+    def test_header(self):
+        self.assertEqual(charset_detection.decode(self.text.encode('cp1252'), 'text/html; charset="windows-1252"'),
+                         (self.text, 'cp1252'))
+        self.assertEqual(charset_detection.decode(self.text.encode('utf-8'), 'application/json')[1], 'utf-8')
+
+    def test_bom(self):
+        self.assertEqual(charset_detection.decode(codecs.BOM_UTF8 + self.text.encode('utf-8'), 'text/html'),
+                         (self.text, 'utf-8-sig'))
+        self.assertEqual(charset_detection.decode(self.text.encode('utf-16'))[1], 'utf-16')
+
+    def test_markup(self):
+        html = '<html><head><meta charset="iso-8859-15"></head><body>10 €</body></html>'
+        self.assertEqual(charset_detection.decode(html.encode('iso-8859-15'), 'text/html'), (html, 'iso8859-15'))
+
+        html = '<meta http-equiv="Content-Type" content="text/html; charset=windows-1252">10 €'
+        self.assertEqual(charset_detection.decode(html.encode('cp1252'))[1], 'cp1252')
+
+        xml = '<?xml version="1.0" encoding="ISO-8859-1"?><rss>Köln</rss>'
+        self.assertEqual(charset_detection.decode(xml.encode('latin-1'), 'application/xml')[1], 'iso8859-1')
+
+        # Unknown names are ignored
+        self.assertEqual(charset_detection.decode(b'<meta charset="nonsense">abc')[1], 'utf-8')
+
+    def test_utf8_and_known_encoding(self):
+        self.assertEqual(charset_detection.decode(self.text.encode('utf-8'), 'text/html'), (self.text, 'utf-8'))
+
+        # What worked for the watch last time is used before trying any detector
+        body = self.text.encode('cp1252')
+        self.assertEqual(charset_detection.decode(body, 'text/html', known_encoding='cp1252'), (self.text, 'cp1252'))
+
+    def test_detector(self):
+        body = ("Grüße aus Köln, schöne Städte und Bäume. " * 200).encode('cp1252')
+        text, encoding = charset_detection.decode(body, 'text/html')
+        self.assertNotEqual(encoding, 'utf-8')
+        self.assertIn("Grüße aus Köln", text)
+
+    def test_truncated_in_a_character(self):
+        # Cut off in the middle of the two bytes of the last 'é'
+        body = ("Café " * 100).encode('utf-8')[:-2]
+        self.assertRaises(UnicodeDecodeError, body.decode, 'utf-8')
+        self.assertEqual(charset_detection.decode(body, 'text/html', truncated=True), ("Café " * 99 + "Caf", 'utf-8'))
+        # Same with the charset from the header, no replacement character at the end
+        self.assertEqual(charset_detection.decode(body, 'text/html; charset=utf-8', truncated=True)[0],
+                         "Café " * 99 + "Caf")
+
+        # Invalid bytes before the end still aren't UTF-8
+        body = self.text.encode('cp1252') + "é".encode('utf-8')[:1]
+        self.assertEqual(charset_detection.decode(body, 'text/html', known_encoding='cp1252', truncated=True)[1],
+                         'cp1252')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+
+# run from dir above changedetectionio/ dir
+# python3 -m unittest changedetectionio.tests.unit.test_history_index
+
+import unittest
+
+from changedetectionio.history import HistoryIndex
+
+
+class TestHistoryIndex(unittest.TestCase):
+
+    def test_sorted_lookups(self):
+        # Insertion order of watch['history'] is not the timestamp order
+        index = HistoryIndex(["300", "100", "1000", "20"])
+
+        self.assertEqual(index.newest(), "1000")
+        self.assertEqual(index.previous(), "300")
+        self.assertEqual(index.previous("300"), "100")
+        self.assertIsNone(index.previous("20"))
+        self.assertEqual(index.nth_newest(3), "20")
+        self.assertIsNone(index.nth_newest(4))
+        self.assertEqual(index.keys(), ["1000", "300", "100", "20"])
+        self.assertEqual(index.range(since=100, until=300), ["300", "100"])
+
+    def test_add_and_remove(self):
+        index = HistoryIndex()
+        self.assertIsNone(index.newest())
+
+        index.add("200")
+        index.add("100")
+        index.add("300")
+        index.add("200")
+        self.assertEqual(index.keys(), ["300", "200", "100"])
+
+        index.remove("300")
+        index.remove("999")
+        self.assertEqual(index.newest(), "200")
+        self.assertEqual(len(index), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
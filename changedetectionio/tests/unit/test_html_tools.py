@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+
+# run from dir above changedetectionio/ dir
+# python3 -m unittest changedetectionio.tests.unit.test_html_tools
+
+import json
+import unittest
+
+from bs4 import BeautifulSoup
+from inscriptis import get_text
+
+from changedetectionio import html_tools
+
+
+@unittest.skipUnless(html_tools.has_lxml, "lxml is not installed")
+class TestLxmlEngine(unittest.TestCase):
+
+    content = """<html><head><title> The title </title>
+    <script type="application/ld+json">{"offers": {"price": 23.5}}</script></head>
+    <body>
+     <p>foo bar blah</p>
+     <div class="parts">Block <b>A</b></div> <div class="parts" data-price="100">Block B</div>
+     <ul id="list"><li>One</li><li>Two</li></ul>
+     <input type="checkbox" name="in-stock" value="Yes" checked> <a href="/more">More</a>
+    </body></html>"""
+
+    # Unclosed tags, a stray </div>, unquoted attributes and a <p> inside a <p>
+    malformed = """<html><body><div class=parts>Block <b>A</div></div>
+     <p>First <p class=parts>Second <span>open
+     <table><tr><td>Cell</table> <div class="parts" data-price=100>Block B"""
+
+    rules = [".parts", "#list li", "ul > li:nth-child(2)", "div[data-price]", "p, .parts", "#nothing", "td",
+             "DIV.parts", "input:checked", "a:link", "input:checked + a"]
+    # Only soupsieve knows these, cssselect can't translate them
+    soupsieve_rules = ['p:-soup-contains("blah")', '.parts:-soup-contains("B")', ':is(p, li):not(:-soup-contains(Two))']
+
+    def test_same_html_as_html_parser(self):
+        # The default is still BeautifulSoup's html.parser with soupsieve, exactly as before
+        for content in [self.content, self.malformed]:
+            soup = BeautifulSoup(content, "html.parser")
+            for rule in self.rules + self.soupsieve_rules:
+                self.assertEqual(
+                    html_tools.css_filter(rule, content),
+                    "".join(str(item) for item in soup.select(rule)) + "\n",
+                    rule
+                )
+
+    def test_same_text_as_html_parser(self):
+        soup = BeautifulSoup(self.content, "html.parser")
+        doc = html_tools.parse_html(self.content, 'lxml')
+        for rule in self.rules + self.soupsieve_rules:
+            self.assertEqual(
+                get_text(html_tools.css_filter(rule, soup=doc)),
+                get_text(html_tools.css_filter(rule, soup=soup)),
+                rule
+            )
+
+    def test_html_selectors_with_lxml(self):
+        # Case insensitive tag names and the HTML pseudo-classes, like soupsieve
+        doc = html_tools.parse_html(self.content, 'lxml')
+        for rule, expected in [("DIV.parts", "Block B"), ("input:checked", 'name="in-stock"'), ("a:link", "More"),
+                               ("input:checked + a", "More")]:
+            self.assertIn(expected, html_tools.css_filter(rule, soup=doc), rule)
+
+    def test_soupsieve_selectors_with_lxml(self):
+        doc = html_tools.parse_html(self.malformed, 'lxml')
+        self.assertNotIsInstance(doc, BeautifulSoup)
+        self.assertIn("Block B", html_tools.css_filter('.parts:-soup-contains("B")', soup=doc))
+        text = get_text(html_tools.css_filter('p:not(:-soup-contains(First))', soup=doc))
+        self.assertIn("Second", text)
+        self.assertNotIn("First", text)
+
+    def test_xpath(self):
+        self.assertEqual(get_text(html_tools.css_filter("xpath://ul[@id='list']/li[1]", self.content)), "* One")
+        self.assertEqual(html_tools.css_filter("xpath://div/@data-price", self.content), "100\n")
+        self.assertEqual(html_tools.parser_for_filter("xpath://div"), 'lxml')
+        self.assertEqual(html_tools.parser_for_filter(".parts"), 'html.parser')
+
+        # Not possible without lxml
+        soup = BeautifulSoup(self.content, "html.parser")
+        self.assertRaises(ValueError, html_tools.css_filter, "xpath://div", soup=soup)
+
+    def test_shared_document(self):
+        self.assertIsInstance(html_tools.parse_html(self.content), BeautifulSoup)
+
+        doc = html_tools.parse_html(self.content, 'lxml')
+        self.assertNotIsInstance(doc, BeautifulSoup)
+        self.assertEqual(html_tools.extract_element(find='title', soup=doc), "The title")
+        self.assertEqual(html_tools.extract_json_as_string(self.content, "json:$.offers.price", soup=doc), "23.5")
+
+    def test_selectors_are_compiled_once(self):
+        html_tools.compile_selector.cache_clear()
+        doc = html_tools.parse_html(self.content, 'lxml')
+        for _ in range(3):
+            html_tools.css_filter(".parts", soup=doc)
+        self.assertEqual(html_tools.compile_selector.cache_info().misses, 1)
+        self.assertEqual(html_tools.compile_selector.cache_info().hits, 2)
+
+
+class TestJSONFilter(unittest.TestCase):
+
+    content = json.dumps({"data": {"items": [{"price": 1.5, "name": "One"}, {"price": 2, "name": "Two"}]},
+                          "meta": {"total": 2}})
+
+    def test_jsonpath_is_compiled_once(self):
+        self.assertIs(html_tools.compile_jsonpath('$.data.items[*].price'),
+                      html_tools.compile_jsonpath('$.data.items[*].price'))
+
+    def test_ijson_prefix(self):
+        self.assertEqual(html_tools.jsonpath_to_ijson_prefix('$.data.items[*].price'), 'data.items.item.price')
+        self.assertEqual(html_tools.jsonpath_to_ijson_prefix('meta.total'), 'meta.total')
+        # Anything more than plain fields and [*] is left to jsonpath_ng
+        for jsonpath_filter in ['$..price', '$.data.items[0]', '$.data.items[?(@.price > 1)]', '$.item', '$']:
+            self.assertIsNone(html_tools.jsonpath_to_ijson_prefix(jsonpath_filter))
+
+    @unittest.skipUnless(html_tools.has_ijson, "ijson is not installed")
+    def test_streamed_same_as_loaded(self):
+        for jsonpath_filter in ['json:$.data.items[*].price', 'json:$.meta.total', 'json:$.meta[*]',
+                                'json:$.data.items', 'json:$.nothing', 'json:$..name']:
+            self.assertEqual(html_tools.extract_json_as_string(self.content, jsonpath_filter),
+                             html_tools._parse_json(json.loads(self.content), jsonpath_filter))
+
+        # Not JSON, still finds the JSON in the <script>
+        html = '<html><script type="application/ld+json">{"meta": {"total": 5}}</script></html>'
+        self.assertEqual(html_tools.extract_json_as_string(html, 'json:$.meta.total'), '5')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+
+# run from dir above changedetectionio/ dir
+# python3 -m unittest changedetectionio.tests.unit.test_http_session_pool
+
+import http.server
+import threading
+import unittest
+
+from changedetectionio.http_session_pool import SessionPool
+
+
+class KeepAliveHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        # Shows the cookies that were sent
+        body = "<html><body>Hello {}</body></html>".format(self.headers.get('Cookie', '')).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Set-Cookie", "session=watch-{}; Path=/".format(self.path.strip('/')))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSessionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}".format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def test_connections_are_reused(self):
+        pool = SessionPool()
+        for i in range(5):
+            session = pool.get_session("{}/page-{}".format(self.url, i))
+            self.assertEqual(session.get("{}/page-{}".format(self.url, i), timeout=5).status_code, 200)
+
+        self.assertEqual(pool.stats(), {'sessions': 1, 'requests': 5, 'connections': 1, 'reused': 4})
+
+        # Same host through a proxy is a different session
+        self.assertIsNot(pool.get_session(self.url, proxy="http://127.0.0.1:1"), session)
+        self.assertEqual(pool.stats()['sessions'], 2)
+
+    def test_idle_sessions_are_closed(self):
+        pool = SessionPool()
+        pool.get_session(self.url).get(self.url, timeout=5)
+        pool.get_session("http://example.com", idle_timeout=300)
+        self.assertEqual(pool.stats()['sessions'], 2)
+
+        # The counts of closed sessions are kept
+        pool.get_session("http://example.com", idle_timeout=-1)
+        self.assertEqual(pool.stats(), {'sessions': 1, 'requests': 1, 'connections': 1, 'reused': 0})
+
+    def test_cookies_are_not_kept_between_watches(self):
+        pool = SessionPool()
+        r = pool.get_session(self.url).get("{}/first".format(self.url), timeout=5)
+        self.assertIn("session=watch-first", r.headers['Set-Cookie'])
+
+        r = pool.get_session(self.url).get("{}/second".format(self.url), timeout=5)
+        self.assertNotIn("session=", r.text)
+        self.assertEqual(len(pool.get_session(self.url).cookies), 0)
+
+        # Cookies from the watch request headers are still sent
+        r = pool.get_session(self.url).get("{}/third".format(self.url), headers={'Cookie': 'mine=1'}, timeout=5)
+        self.assertIn("Hello mine=1", r.text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+#!/usr/bin/python3
+
+# run from dir above changedetectionio/ dir
+# python3 -m unittest changedetectionio.tests.unit.test_ignore_text
+
+import unittest
+
+from changedetectionio import fetch_site_status
+
+
+class TestStripIgnoreText(unittest.TestCase):
+
+    content = """Some text
+    Plain Ignore me
+    plain ignore me, different case
+
+    Price is 100.00 today
+    price IS 55
+    tomorrow tomorrow
+    [brackets] are literal
+    Keep this"""
+
+    def test_strip_ignore_text(self):
+        rules = ['Ignore me', '[brackets]', '/price is \\d+/', '/(tomorrow) \\1/', '/invalid(regex/']
+        text = fetch_site_status.strip_ignore_text(self.content, rules)
+
+        # Plain text is case sensitive, regex is not, blank lines are always removed
+        self.assertEqual(text, b"Some text\n    plain ignore me, different case\n    Keep this")
+
+    def test_matcher_is_cached(self):
+        rules = ['Ignore me', '/price is \\d+/']
+        matcher = fetch_site_status.get_ignore_text_matcher(tuple(rules))
+        self.assertIs(fetch_site_status.get_ignore_text_matcher(tuple(rules)), matcher)
+        # The backreference can't go in the combined regex
+        self.assertEqual(len(fetch_site_status.get_ignore_text_matcher(('/(a) \\1/',)).separate), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
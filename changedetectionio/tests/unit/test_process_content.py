@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+
+# run from dir above changedetectionio/ dir
+# python3 -m unittest changedetectionio.tests.unit.test_process_content
+
+import unittest
+
+from changedetectionio import fetch_site_status
+
+
+class TestProcessFetchedContent(unittest.TestCase):
+
+    content = """<html><head><title>The title</title></head>
+    <body>
+     <div id="main">Some text<br>Ignore this line<br>The price is 100</div>
+     <div>Not in the filter</div>
+    </body></html>"""
+
+    watch = {
+        'css_filter': '#main',
+        'ignore_text': ['Ignore this'],
+        'trigger_text': ['/price is \\d+/'],
+        'previous_md5': 'abc',
+        'title': None,
+        'extract_title_as_title': True,
+    }
+
+    def test_process_fetched_content(self):
+        changed, update_obj, text = fetch_site_status.process_fetched_content(
+            self.content, 200, self.watch, False, {'last_checked': 1000, 'history': {}})
+
+        self.assertTrue(changed)
+        self.assertEqual(text, b"  Some text\n  The price is 100")
+        self.assertEqual(update_obj['last_changed'], 1000)
+        self.assertEqual(update_obj['last_check_status'], 200)
+        self.assertEqual(update_obj['title'], "The title")
+
+        # The CSS filter and the title share one parse of the document
+        self.assertEqual(update_obj['check_timings']['html_parses'], 1)
+
+    def test_same_result_from_process_pool(self):
+        args = (self.content, 200, self.watch, False, {'last_checked': 1000, 'history': {}})
+        future = fetch_site_status.get_process_pool(1).submit(fetch_site_status.process_fetched_content, *args)
+
+        pool_result = future.result(timeout=60)
+        local_result = fetch_site_status.process_fetched_content(*args)
+        # Apart from how long it took
+        del pool_result[1]['check_timings'], local_result[1]['check_timings']
+        self.assertEqual(pool_result, local_result)
+
+    def test_trigger_text(self):
+        text = "Some text\nThe PRICE is 100\nÜber café"
+        matcher = fetch_site_status.get_trigger_text_matcher(('nothing here', '/price is \\d+/'))
+        self.assertTrue(matcher.matches(text))
+        # Plain text is case insensitive, and works on the decoded text
+        self.assertTrue(fetch_site_status.get_trigger_text_matcher(('über CAFÉ',)).matches(text))
+        self.assertFalse(fetch_site_status.get_trigger_text_matcher(('missing', '/price is \\d{4}/')).matches(text))
+        self.assertIs(fetch_site_status.get_trigger_text_matcher(('missing',)),
+                      fetch_site_status.get_trigger_text_matcher(('missing',)))
+
+        watch = dict(self.watch, trigger_text=['not on the page'])
+        changed, update_obj, text = fetch_site_status.process_fetched_content(
+            self.content, 200, watch, False, {'last_checked': 1000, 'history': {}})
+        self.assertFalse(changed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+
+# run from dir above changedetectionio/ dir
+# python3 -m unittest changedetectionio.tests.unit.test_scheduler
+
+import tempfile
+import unittest
+
+from changedetectionio import store
+from changedetectionio.scheduler import WatchScheduler
+
+
+class TestWatchScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.datastore = store.ChangeDetectionStore(datastore_path=tempfile.mkdtemp(), include_default_watches=False)
+        self.datastore.data['settings']['requests']['minutes_between_check'] = 100
+        self.scheduler = WatchScheduler(self.datastore)
+
+    def tearDown(self):
+        self.datastore.stop_thread = True
+
+    def add_watch(self, last_checked, **extras):
+        uuid = self.datastore.add_watch(url="http://example.com", tag="", extras=extras)
+        self.datastore.update_watch(uuid, {"last_checked": last_checked})
+        return uuid
+
+    def test_only_due_watches_are_returned(self):
+        due = self.add_watch(last_checked=1000)
+        own_interval = self.add_watch(last_checked=1000, minutes_between_check=10)
+        later = self.add_watch(last_checked=1090)
+        self.add_watch(last_checked=0, paused=True)
+        self.scheduler.schedule_all()
+
+        self.assertEqual(self.scheduler.pop_due(now=1100), [own_interval, due])
+        # They are out of the schedule until the check is done
+        self.assertEqual(self.scheduler.pop_due(now=1100), [])
+        self.assertEqual(self.scheduler.pop_due(now=1190), [later])
+
+    def test_reschedule_after_changes(self):
+        uuid = self.add_watch(last_checked=1000)
+        deleted = self.add_watch(last_checked=1000)
+        self.scheduler.schedule_all()
+
+        # Checked since it was scheduled, it's moved to the new due time instead
+        self.datastore.update_watch(uuid, {"last_checked": 1050})
+        self.datastore.delete(deleted)
+        self.assertEqual(self.scheduler.pop_due(now=1100), [])
+        self.assertEqual(self.scheduler.pop_due(now=1150), [uuid])
+
+        # Check finished, goes back in from its new last_checked
+        self.datastore.update_watch(uuid, {"last_checked": 1150})
+        self.scheduler.schedule(uuid)
+        self.assertEqual(self.scheduler.pop_due(now=1200), [])
+        self.assertEqual(self.scheduler.pop_due(now=1250), [uuid])
+
+
+if __name__ == '__main__':
+    unittest.main()
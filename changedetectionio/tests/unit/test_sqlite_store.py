@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+
+# run from dir above changedetectionio/ dir
+# python3 -m unittest changedetectionio.tests.unit.test_sqlite_store
+
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from changedetectionio import store
+
+
+class TestSQLiteStore(unittest.TestCase):
+
+    def setUp(self):
+        self.datastore_path = tempfile.mkdtemp()
+        self.datastores = []
+
+    def tearDown(self):
+        for datastore in self.datastores:
+            datastore.stop_thread = True
+
+    def new_store(self, **kwargs):
+        datastore = store.ChangeDetectionStore(datastore_path=self.datastore_path,
+                                               include_default_watches=False,
+                                               **kwargs)
+        self.datastores.append(datastore)
+        return datastore
+
+    def test_only_changed_watches_are_written(self):
+        datastore = self.new_store(datastore_backend="sqlite")
+        uuid_a = datastore.add_watch(url="http://a.com", tag="")
+        uuid_b = datastore.add_watch(url="http://b.com", tag="")
+
+        datastore.update_watch(uuid_a, {"title": "A title"})
+        datastore.sync_to_disk()
+
+        conn = sqlite3.connect(datastore.sqlite_store.db_path)
+        rows = dict(conn.execute("SELECT uuid, data FROM watches"))
+        conn.close()
+        self.assertEqual(json.loads(rows[uuid_a])['title'], "A title")
+        self.assertIn(uuid_b, rows)
+
+        datastore.delete(uuid_b)
+        datastore.sync_to_disk()
+
+        reloaded = self.new_store(datastore_backend="sqlite")
+        self.assertEqual(reloaded.data['watching'][uuid_a]['title'], "A title")
+        self.assertNotIn(uuid_b, reloaded.data['watching'])
+        self.assertEqual(reloaded.data['app_guid'], datastore.data['app_guid'])
+
+    def test_save_writes_only_changed_rows(self):
+        datastore = self.new_store(datastore_backend="sqlite")
+        uuids = [datastore.add_watch(url="http://{}.com".format(i), tag="") for i in range(5)]
+        datastore.sync_to_disk()
+
+        # Every statement sent to SQLite, from this thread or the datastore thread
+        statements = []
+        connect = datastore.sqlite_store.connect
+
+        def traced_connect():
+            conn = connect()
+            conn.set_trace_callback(statements.append)
+            return conn
+
+        with mock.patch.object(datastore.sqlite_store, 'connect', traced_connect):
+            datastore.update_watch(uuids[2], {"title": "Only this one"})
+            datastore.sync_to_disk()
+            written = [sql for sql in statements if sql.startswith("INSERT OR REPLACE INTO watches")]
+            self.assertEqual(len(written), 1)
+            self.assertIn(uuids[2], written[0])
+
+            # Nothing changed, no watch rows at all
+            statements.clear()
+            datastore.sync_to_disk()
+            self.assertFalse([sql for sql in statements if "INTO watches" in sql or "FROM watches" in sql])
+
+    def test_migrate_from_json(self):
+        datastore = self.new_store(datastore_backend="json")
+        uuid = datastore.add_watch(url="http://migrate-me.com", tag="old")
+        datastore.sync_to_json()
+        self.assertFalse(os.path.isfile(os.path.join(self.datastore_path, "url-watches.db")))
+
+        migrated = self.new_store(datastore_backend="sqlite")
+        migrated.sync_to_disk()
+
+        reloaded = self.new_store(datastore_backend="sqlite")
+        self.assertEqual(reloaded.data['watching'][uuid]['url'], "http://migrate-me.com")
+        self.assertEqual(reloaded.data['watching'][uuid]['tag'], "old")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+
+# run from dir above changedetectionio/ dir
+# python3 -m unittest changedetectionio.tests.unit.test_store_journal
+
+import os
+import tempfile
+import threading
+import unittest
+
+from changedetectionio import store
+
+
+class TestStoreJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.datastore_path = tempfile.mkdtemp()
+        self.json_store_path = os.path.join(self.datastore_path, "url-watches.json")
+        self.datastores = []
+
+    def tearDown(self):
+        for datastore in self.datastores:
+            datastore.stop_thread = True
+
+    def new_store(self):
+        datastore = store.ChangeDetectionStore(datastore_path=self.datastore_path,
+                                               include_default_watches=False,
+                                               checkpoint_minutes=10)
+        self.datastores.append(datastore)
+        return datastore
+
+    def test_replay_without_checkpoint(self):
+        datastore = self.new_store()
+        keep_uuid = datastore.add_watch(url="http://keep.com", tag="")
+        delete_uuid = datastore.add_watch(url="http://delete.com", tag="")
+
+        datastore.update_watch(keep_uuid, {"title": "Kept", "history": {"100": "/tmp/100.txt"}})
+        datastore.update_watch(keep_uuid, {"history": {"200": "/tmp/200.txt"}})
+        datastore.set_last_viewed(keep_uuid, 100)
+        datastore.delete(delete_uuid)
+
+        # Nothing was rewritten, it's all in the journal
+        self.assertFalse(os.path.isfile(self.json_store_path))
+
+        reloaded = self.new_store()
+        watch = reloaded.data['watching'][keep_uuid]
+        self.assertEqual(watch['title'], "Kept")
+        self.assertEqual(watch['history'], {"100": "/tmp/100.txt", "200": "/tmp/200.txt"})
+        self.assertEqual(watch['last_viewed'], 100)
+        self.assertNotIn(delete_uuid, reloaded.data['watching'])
+
+    def test_checkpoint_folds_journal(self):
+        datastore = self.new_store()
+        uuid = datastore.add_watch(url="http://checkpoint.com", tag="")
+        datastore.sync_to_json()
+
+        self.assertTrue(os.path.isfile(self.json_store_path))
+        self.assertFalse(datastore.journal.has_records())
+
+        # Changes after the checkpoint are replayed on top of url-watches.json
+        datastore.update_watch(uuid, {"title": "After checkpoint"})
+        reloaded = self.new_store()
+        self.assertEqual(reloaded.data['watching'][uuid]['title'], "After checkpoint")
+
+    def test_settings_only_journalled_when_changed(self):
+        datastore = self.new_store()
+        for _ in range(3):
+            datastore.sync_to_journal()
+        datastore.data['settings']['requests']['timeout'] = 30
+        datastore.sync_to_journal()
+        datastore.sync_to_journal()
+
+        metas = [record for record in datastore.journal.replay() if record['op'] == 'meta']
+        self.assertEqual(len(metas), 2)
+        self.assertEqual(metas[-1]['data']['settings']['requests']['timeout'], 30)
+        self.assertEqual(self.new_store().data['settings']['requests']['timeout'], 30)
+
+    def test_history_index_follows_updates(self):
+        datastore = self.new_store()
+        uuid = datastore.add_watch(url="http://history.com", tag="")
+        lookups = []
+
+        # Another thread wants the index right while the new snapshot is being added to the history
+        class BusyHistory(dict):
+            def update(self, *args, **kwargs):
+                lookup = threading.Thread(target=datastore.get_history_index, args=(uuid,))
+                lookup.start()
+                lookup.join(0.2)
+                lookups.append(lookup)
+                super().update(*args, **kwargs)
+
+        datastore.data['watching'][uuid]['history'] = BusyHistory({"100": "/tmp/100.txt"})
+        datastore.mark_watch_dirty(uuid)
+        # Not built, like just after mark_watch_dirty() in another thread
+        datastore._ChangeDetectionStore__history_index.pop(uuid)
+
+        datastore.update_watch(uuid, {"history": {"200": "/tmp/200.txt"}})
+        lookups[0].join()
+        self.assertEqual(datastore.get_history_index(uuid).keys(), ["200", "100"])
+
+        # Already built, the new one is added to it
+        datastore.update_watch(uuid, {"history": {"300": "/tmp/300.txt"}})
+        lookups[1].join()
+        self.assertEqual(datastore.get_history_index(uuid).keys(), ["300", "200", "100"])
+
+if __name__ == '__main__':
+    unittest.main()
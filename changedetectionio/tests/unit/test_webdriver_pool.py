@@ -0,0 +1,239 @@
+#!/usr/bin/python3
+
+# run from dir above changedetectionio/ dir
+# python3 -m unittest changedetectionio.tests.unit.test_webdriver_pool
+
+import http.server
+import json
+import threading
+import unittest
+import uuid
+import time
+from unittest import mock
+
+import urllib3
+
+from changedetectionio import content_fetcher
+from changedetectionio.webdriver_pool import NoSessionAvailable, WebDriverPool, driver_pool
+
+
+# Just enough of the W3C WebDriver protocol for selenium's Remote driver
+class StandInWebDriver(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    sessions = {}
+    created = 0
+    quit = 0
+    cdp_commands = []
+    # Like Selenium Grid or a Firefox node
+    has_cdp = True
+
+    def reply(self, value, status=200):
+        body = json.dumps({"value": value}).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def session(self):
+        session_id = self.path.split('/')[2]
+        if session_id not in self.sessions:
+            self.reply({"error": "invalid session id", "message": "No such session", "stacktrace": ""}, 404)
+            return None
+        return session_id
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        cls = StandInWebDriver
+
+        if self.path == '/session':
+            session_id = uuid.uuid4().hex
+            cls.sessions[session_id] = "about:blank"
+            cls.created += 1
+            self.reply({"sessionId": session_id, "capabilities": {"browserName": "chrome"}})
+
+        elif self.path.endswith('/url'):
+            session_id = self.session()
+            if session_id:
+                cls.sessions[session_id] = json.loads(body)['url']
+                self.reply(None)
+
+        elif self.path.endswith('/goog/cdp/execute'):
+            if not cls.has_cdp:
+                self.reply({"error": "unknown command", "message": "Unknown command", "stacktrace": ""}, 404)
+            elif self.session():
+                cls.cdp_commands.append(json.loads(body)['cmd'])
+                self.reply({})
+
+        # The script that checks if the page is done
+        elif self.path.endswith('/execute/sync'):
+            if self.session():
+                self.reply({"ready": "complete", "quiet": 1000, "found": None})
+
+    def do_GET(self):
+        session_id = self.session()
+        if session_id:
+            self.reply("<html><body>Page {}</body></html>".format(self.sessions[session_id]))
+
+    def do_DELETE(self):
+        session_id = self.session()
+        if not session_id:
+            return
+
+        del self.sessions[session_id]
+        StandInWebDriver.quit += 1
+        self.reply(None)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestWebDriverPool(unittest.TestCase):
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StandInWebDriver)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}".format(self.server.server_port)
+        StandInWebDriver.sessions = {}
+        StandInWebDriver.created = StandInWebDriver.quit = 0
+        StandInWebDriver.cdp_commands = []
+        StandInWebDriver.has_cdp = True
+
+    def tearDown(self):
+        driver_pool.close_all()
+        self.server.shutdown()
+
+    def test_sessions_are_reused_and_reset(self):
+        pool = WebDriverPool()
+        for i in range(3):
+            session = pool.acquire(self.url, max_sessions=2)
+            session.driver.get("http://example.com/{}".format(i))
+            self.assertIn("example.com/{}".format(i), session.driver.page_source)
+            pool.release(session)
+
+        self.assertEqual(StandInWebDriver.created, 1)
+        # Every site's cookies and storage, not only the current page's cookies
+        self.assertEqual(StandInWebDriver.cdp_commands, ["Network.clearBrowserCookies", "Storage.clearDataForOrigin"] * 3)
+        # Back on a blank page while it waits
+        self.assertEqual(list(StandInWebDriver.sessions.values()), ["about:blank"])
+        self.assertEqual(pool.stats(), {'max': 2, 'open': 1, 'in_use': 0, 'utilisation': 0.0,
+                                        'created': 1, 'reused': 2, 'recycled': 0})
+
+    def test_sessions_are_recycled(self):
+        pool = WebDriverPool()
+        first = pool.acquire(self.url, max_sessions=2)
+        second = pool.acquire(self.url)
+        self.assertEqual(pool.stats()['utilisation'], 100.0)
+
+        # Used up, and one that had an error
+        first.uses = 49
+        pool.release(first, max_uses=50)
+        pool.release(second, discard=True)
+
+        self.assertEqual(StandInWebDriver.quit, 2)
+        self.assertEqual(pool.stats()['open'], 0)
+        self.assertEqual(pool.stats()['recycled'], 2)
+
+    def test_sessions_that_cant_be_cleared_are_not_reused(self):
+        StandInWebDriver.has_cdp = False
+        pool = WebDriverPool()
+        for i in range(2):
+            pool.release(pool.acquire(self.url, max_sessions=2))
+
+        self.assertEqual(StandInWebDriver.created, 2)
+        self.assertEqual(StandInWebDriver.quit, 2)
+        self.assertEqual(pool.stats()['reused'], 0)
+        self.assertEqual(pool.stats()['recycled'], 2)
+
+    def test_fetcher_uses_the_pool(self):
+        fetcher = content_fetcher.html_webdriver()
+        fetcher.command_executor = self.url
+        created = driver_pool.stats()['created']
+
+        # Warms up the pool instead of starting and quitting its own session
+        self.assertTrue(fetcher.is_ready())
+        fetcher.run("http://example.com/", 10, {})
+        self.assertIn("example.com", fetcher.content)
+
+        # The WebDriver server dropped the session, a new one is started
+        StandInWebDriver.sessions.clear()
+        fetcher.run("http://example.com/again", 10, {})
+        self.assertIn("example.com/again", fetcher.content)
+
+        self.assertEqual(driver_pool.stats()['created'] - created, 2)
+        self.assertEqual(StandInWebDriver.created, 2)
+
+    def test_session_is_given_back_after_other_errors(self):
+        fetcher = content_fetcher.html_webdriver()
+        fetcher.command_executor = self.url
+
+        # Not a WebDriverException, like the WebDriver server connection dropping during the page load
+        with mock.patch('selenium.webdriver.remote.webdriver.WebDriver.get',
+                        side_effect=urllib3.exceptions.ProtocolError("Connection aborted")):
+            for i in range(3):
+                with self.assertRaises(urllib3.exceptions.ProtocolError):
+                    fetcher.run("http://example.com/", 10, {})
+
+        self.assertEqual(driver_pool.stats()['in_use'], 0)
+        self.assertEqual(StandInWebDriver.quit, 3)
+
+        # The pool still hands out sessions
+        fetcher.run("http://example.com/after", 10, {})
+        self.assertIn("example.com/after", fetcher.content)
+
+    def test_waiting_for_a_session_times_out(self):
+        pool = WebDriverPool()
+        session = pool.acquire(self.url, max_sessions=1)
+
+        now = time.time()
+        with self.assertRaises(NoSessionAvailable):
+            pool.acquire(self.url, wait_timeout=0.2)
+        self.assertLess(time.time() - now, 1)
+
+        # Nothing was taken by the one that gave up
+        pool.release(session)
+        self.assertEqual(pool.acquire(self.url, wait_timeout=0.2), session)
+
+
+# Gives the page states in order, the last one again after that
+class FakeDriver:
+
+    def __init__(self, states):
+        self.states = states
+        self.calls = 0
+
+    def execute_script(self, script, *args):
+        self.calls += 1
+        return self.states[min(self.calls, len(self.states)) - 1]
+
+
+class TestWaitUntilSettled(unittest.TestCase):
+
+    def setUp(self):
+        self.fetcher = content_fetcher.html_webdriver()
+        self.fetcher.poll_seconds = 0.01
+
+    def test_dom_stopped_changing(self):
+        driver = FakeDriver([{"ready": "loading", "quiet": 0, "found": None},
+                             {"ready": "complete", "quiet": 100, "found": None},
+                             {"ready": "complete", "quiet": 600, "found": None}])
+        self.assertTrue(self.fetcher.wait_until_settled(driver))
+        self.assertEqual(driver.calls, 3)
+
+    def test_wait_for_selector(self):
+        # Quiet isn't enough when there's an element to wait for
+        self.fetcher.wait_for_selector = ".price"
+        driver = FakeDriver([{"ready": "complete", "quiet": 5000, "found": False},
+                             {"ready": "complete", "quiet": 0, "found": True}])
+        self.assertTrue(self.fetcher.wait_until_settled(driver))
+        self.assertEqual(driver.calls, 2)
+
+    def test_max_wait(self):
+        self.fetcher.max_wait = 0.2
+        now = time.time()
+        self.assertFalse(self.fetcher.wait_until_settled(FakeDriver([{"ready": "complete", "quiet": 0, "found": None}])))
+        self.assertLess(time.time() - now, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+
+# run from dir above changedetectionio/ dir
+# python3 -m unittest changedetectionio.tests.unit.test_work_queue
+
+import queue
+import threading
+import unittest
+
+from changedetectionio.work_queue import UniqueWorkQueue
+
+
+class TestUniqueWorkQueue(unittest.TestCase):
+
+    def test_duplicates_are_dropped(self):
+        q = UniqueWorkQueue()
+        self.assertTrue(q.put("a"))
+        self.assertTrue(q.put("b"))
+        self.assertFalse(q.put("a"))
+        self.assertEqual(q.qsize(), 2)
+        self.assertIn("a", q)
+        self.assertNotIn("c", q)
+
+        self.assertEqual(q.get(block=False), "a")
+        self.assertEqual(q.get(block=False), "b")
+        self.assertRaises(queue.Empty, q.get, block=False)
+        self.assertRaises(queue.Empty, q.get, timeout=0.01)
+
+    def test_in_flight(self):
+        q = UniqueWorkQueue()
+        q.put("a")
+        uuid = q.get(block=False)
+        self.assertTrue(q.is_in_flight(uuid))
+        self.assertIn(uuid, q)
+
+        # Can be queued again while it's being checked, for example after the watch was edited
+        self.assertTrue(q.put(uuid))
+        self.assertEqual(q.qsize(), 1)
+
+        q.task_done(uuid)
+        self.assertFalse(q.is_in_flight(uuid))
+        self.assertIn(uuid, q)
+
+    def test_interactive_lane_first(self):
+        q = UniqueWorkQueue(interactive_burst=2)
+        for uuid in ["s1", "s2", "s3"]:
+            q.put(uuid)
+        for uuid in ["i1", "i2", "i3"]:
+            q.put(uuid, interactive=True)
+
+        # Already waiting in the scheduled lane, moves up to the interactive lane
+        self.assertTrue(q.put("s3", interactive=True))
+        self.assertFalse(q.put("s3"))
+        self.assertEqual(q.qsize(), 6)
+
+        # One scheduled job gets through after every 2 interactive ones
+        order = [q.get(block=False) for _ in range(6)]
+        self.assertEqual(order, ["i1", "i2", "s1", "i3", "s3", "s2"])
+        self.assertTrue(q.empty())
+
+    def test_no_burst_limit(self):
+        q = UniqueWorkQueue(interactive_burst=0)
+        q.put("s1")
+        for uuid in ["i1", "i2", "i3"]:
+            q.put(uuid, interactive=True)
+
+        order = [q.get(block=False) for _ in range(4)]
+        self.assertEqual(order, ["i1", "i2", "i3", "s1"])
+
+    def test_close_wakes_up_waiting_get(self):
+        q = UniqueWorkQueue()
+        got = []
+        t = threading.Thread(target=lambda: got.append(q.get(timeout=10)))
+        t.start()
+        q.close()
+        t.join(timeout=2)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(got, [None])
+
+
+if __name__ == '__main__':
+    unittest.main()
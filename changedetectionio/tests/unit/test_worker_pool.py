@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+
+# run from dir above changedetectionio/ dir
+# python3 -m unittest changedetectionio.tests.unit.test_worker_pool
+
+import queue
+import tempfile
+import unittest
+from threading import Event
+from unittest.mock import MagicMock
+
+from changedetectionio import store
+from changedetectionio.work_queue import UniqueWorkQueue
+from changedetectionio.worker_pool import WorkerPool
+
+
+class TestWorkerPool(unittest.TestCase):
+
+    def setUp(self):
+        self.datastore = store.ChangeDetectionStore(datastore_path=tempfile.mkdtemp(), include_default_watches=False)
+        self.datastore.data['settings']['requests']['workers_min'] = 2
+        self.datastore.data['settings']['requests']['workers'] = 20
+        self.app = MagicMock()
+        self.app.config.exit = Event()
+        self.q = UniqueWorkQueue()
+        self.pool = WorkerPool(self.q, queue.Queue(), self.app, self.datastore)
+
+    def tearDown(self):
+        self.app.config.exit.set()
+        self.q.close()
+        self.datastore.stop_thread = True
+
+    def test_desired_size(self):
+        self.pool.avg_fetch_time = 3
+        self.assertEqual(self.pool.desired_size(queued=0, in_flight=0), 2)
+        # 3 seconds each, 100 of them should be done in 30 seconds
+        self.assertEqual(self.pool.desired_size(queued=100, in_flight=0), 10)
+        self.assertEqual(self.pool.desired_size(queued=5000, in_flight=0), 20)
+
+        # Faster fetches need fewer workers for the same queue
+        for _ in range(50):
+            self.pool.record_fetch_time(0.2)
+        self.assertEqual(self.pool.desired_size(queued=100, in_flight=3), 4)
+
+    def test_grow_and_shrink(self):
+        self.pool.resize()
+        self.assertEqual(len(self.pool), 2)
+
+        # Settings changed, applies on the next resize
+        self.datastore.data['settings']['requests']['workers_min'] = 5
+        self.pool.resize()
+        self.assertEqual(len(self.pool), 5)
+
+        self.datastore.data['settings']['requests']['workers_min'] = 1
+        self.pool.resize()
+        worker = self.pool.workers[0]
+        self.assertTrue(self.pool.retire(worker))
+        self.assertNotIn(worker, self.pool.workers)
+        for worker in list(self.pool.workers):
+            self.pool.retire(worker)
+        self.assertEqual(len(self.pool), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
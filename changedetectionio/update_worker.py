@@ -2,15 +2,83 @@ import threading
 import queue
 import time
 
+
+# What to do with the result of a check, save it, update the snapshot history and queue any notifications
+# Used by the local update_worker threads, and for the results sent back by remote workers (see remote_worker.py)
+def process_check_result(datastore, notification_q, uuid, changed_detected, update_obj, contents):
+    if update_obj:
+        try:
+            datastore.update_watch(uuid=uuid, update_obj=update_obj)
+            if changed_detected:
+                n_object = {}
+                # A change was detected
+                fname = datastore.save_history_text(watch_uuid=uuid, contents=contents)
+
+                # Update history with the stripped text for future reference, this will also mean we save the first
+                # Should always be keyed by string(timestamp)
+                datastore.update_watch(uuid, {"history": {str(update_obj["last_checked"]): fname}})
+
+                watch = datastore.data['watching'][uuid]
+
+                print (">> Change detected in UUID {} - {}".format(uuid, watch['url']))
+
+                # Notifications should only trigger on the second time (first time, we gather the initial snapshot)
+                if len(watch['history']) > 1:
+
+                    prev_fname = watch['history'][datastore.get_history_index(uuid).previous()]
+
+
+                    # Did it have any notification alerts to hit?
+                    if len(watch['notification_urls']):
+                        print(">>> Notifications queued for UUID from watch {}".format(uuid))
+                        n_object['notification_urls'] = watch['notification_urls']
+                        n_object['notification_title'] = watch['notification_title']
+                        n_object['notification_body'] = watch['notification_body']
+                        n_object['notification_format'] = watch['notification_format']
+
+                    # No? maybe theres a global setting, queue them all
+                    elif len(datastore.data['settings']['application']['notification_urls']):
+                        print(">>> Watch notification URLs were empty, using GLOBAL notifications for UUID: {}".format(uuid))
+                        n_object['notification_urls'] = datastore.data['settings']['application']['notification_urls']
+                        n_object['notification_title'] = datastore.data['settings']['application']['notification_title']
+                        n_object['notification_body'] = datastore.data['settings']['application']['notification_body']
+                        n_object['notification_format'] = datastore.data['settings']['application']['notification_format']
+                    else:
+                        print(">>> NO notifications queued, watch and global notification URLs were empty.")
+
+                    # Only prepare to notify if the rules above matched
+                    if 'notification_urls' in n_object:
+                        # HTML needs linebreak, but MarkDown and Text can use a linefeed
+                        if n_object['notification_format'] == 'HTML':
+                            line_feed_sep = "</br>"
+                        else:
+                            line_feed_sep = "\n"
+
+                        from changedetectionio import diff
+                        n_object.update({
+                            'watch_url': watch['url'],
+                            'uuid': uuid,
+                            'current_snapshot': str(contents),
+                            'diff_full': diff.render_diff(prev_fname, fname, line_feed_sep=line_feed_sep),
+                            'diff': diff.render_diff(prev_fname, fname, True, line_feed_sep=line_feed_sep)
+                        })
+
+                        notification_q.put(n_object)
+
+        except Exception as e:
+            print("!!!! Exception in update_worker !!!\n", e)
+
+
 # Requests for checking on the site use a pool of thread Workers managed by a Queue.
 class update_worker(threading.Thread):
-    current_uuid = None
 
-    def __init__(self, q, notification_q, app, datastore, *args, **kwargs):
+    def __init__(self, q, notification_q, app, datastore, scheduler=None, pool=None, *args, **kwargs):
         self.q = q
         self.app = app
         self.notification_q = notification_q
         self.datastore = datastore
+        self.scheduler = scheduler
+        self.pool = pool
         super().__init__(*args, **kwargs)
 
     def run(self):
@@ -20,108 +88,62 @@ class update_worker(threading.Thread):
 
         while not self.app.config.exit.is_set():
 
+            # Wakes up as soon as there is work, the timeout is only so the exit flag is looked at now and then
             try:
-                uuid = self.q.get(block=False)
+                uuid = self.q.get(timeout=1)
             except queue.Empty:
-                pass
+                # Nothing to do, exit if the pool is bigger than it needs to be
+                if self.pool and self.pool.retire(self):
+                    break
 
             else:
-                self.current_uuid = uuid
-                from changedetectionio import content_fetcher
+                # Shutting down, see stop_threads()
+                if uuid is None:
+                    break
+
+                if uuid in self.datastore.data['watching']:
+                    now = time.time()
+                    future = update_handler.start(uuid)
+
+                    # html_async, the result is handled when the fetch is done, this worker can take the next one
+                    if future:
+                        future.add_done_callback(lambda f, uuid=uuid, now=now: self.complete(uuid, now, f.result))
+                        continue
+
+                    self.complete(uuid, now, lambda: update_handler.run(uuid), record_fetch_time=True)
+                else:
+                    self.complete(uuid)
+
+    # Saves the result of the check, 'check' returns what perform_site_check.run() returns
+    # Also called from the thread that finished an html_async check, so only uses 'uuid' and what's passed
+    # 'record_fetch_time' is only for the checks that held a worker for the time of the fetch
+    def complete(self, uuid, started=None, check=None, record_fetch_time=False):
+        from changedetectionio import content_fetcher
+
+        if check:
+            try:
+                changed_detected, update_obj, contents = check()
 
-                if uuid in list(self.datastore.data['watching'].keys()):
+                # Always record that we atleast tried
+                fetch_time = time.time() - started
+                self.datastore.update_watch(uuid=uuid, update_obj={'fetch_time': round(fetch_time, 3)})
+                if self.pool and record_fetch_time:
+                    self.pool.record_fetch_time(fetch_time)
 
-                    changed_detected = False
-                    contents = ""
-                    update_obj= {}
+            except PermissionError as e:
+                self.app.logger.error("File permission error updating", uuid, str(e))
+            except content_fetcher.EmptyReply as e:
+                self.datastore.update_watch(uuid=uuid, update_obj={'last_error':str(e)})
 
-                    try:
-                        now = time.time()
-                        changed_detected, update_obj, contents = update_handler.run(uuid)
+            except Exception as e:
+                self.app.logger.error("Exception reached processing watch UUID:%s - %s", uuid, str(e))
+                self.datastore.update_watch(uuid=uuid, update_obj={'last_error': str(e)})
 
-                        # Always record that we atleast tried
-                        self.datastore.update_watch(uuid=uuid, update_obj={'fetch_time': round(time.time() - now, 3)})
+            else:
+                process_check_result(self.datastore, self.notification_q, uuid, changed_detected, update_obj, contents)
 
-                    except PermissionError as e:
-                        self.app.logger.error("File permission error updating", uuid, str(e))
-                    except content_fetcher.EmptyReply as e:
-                        self.datastore.update_watch(uuid=uuid, update_obj={'last_error':str(e)})
+        # Work out when it's next due from the new last_checked
+        if self.scheduler:
+            self.scheduler.schedule(uuid)
 
-                    except Exception as e:
-                        self.app.logger.error("Exception reached processing watch UUID:%s - %s", uuid, str(e))
-                        self.datastore.update_watch(uuid=uuid, update_obj={'last_error': str(e)})
- 
-                    else:
-                        if update_obj:
-                            try:
-                                self.datastore.update_watch(uuid=uuid, update_obj=update_obj)
-                                if changed_detected:
-                                    n_object = {}
-                                    # A change was detected
-                                    fname = self.datastore.save_history_text(watch_uuid=uuid, contents=contents)
-
-                                    # Update history with the stripped text for future reference, this will also mean we save the first
-                                    # Should always be keyed by string(timestamp)
-                                    self.datastore.update_watch(uuid, {"history": {str(update_obj["last_checked"]): fname}})
-
-                                    watch = self.datastore.data['watching'][uuid]
-
-                                    print (">> Change detected in UUID {} - {}".format(uuid, watch['url']))
-
-                                    # Notifications should only trigger on the second time (first time, we gather the initial snapshot)
-                                    if len(watch['history']) > 1:
-
-                                        dates = list(watch['history'].keys())
-                                        # Convert to int, sort and back to str again
-                                        # @todo replace datastore getter that does this automatically
-                                        dates = [int(i) for i in dates]
-                                        dates.sort(reverse=True)
-                                        dates = [str(i) for i in dates]
-
-                                        prev_fname = watch['history'][dates[1]]
-
-
-                                        # Did it have any notification alerts to hit?
-                                        if len(watch['notification_urls']):
-                                            print(">>> Notifications queued for UUID from watch {}".format(uuid))
-                                            n_object['notification_urls'] = watch['notification_urls']
-                                            n_object['notification_title'] = watch['notification_title']
-                                            n_object['notification_body'] = watch['notification_body']
-                                            n_object['notification_format'] = watch['notification_format']
-
-                                        # No? maybe theres a global setting, queue them all
-                                        elif len(self.datastore.data['settings']['application']['notification_urls']):
-                                            print(">>> Watch notification URLs were empty, using GLOBAL notifications for UUID: {}".format(uuid))
-                                            n_object['notification_urls'] = self.datastore.data['settings']['application']['notification_urls']
-                                            n_object['notification_title'] = self.datastore.data['settings']['application']['notification_title']
-                                            n_object['notification_body'] = self.datastore.data['settings']['application']['notification_body']
-                                            n_object['notification_format'] = self.datastore.data['settings']['application']['notification_format']
-                                        else:
-                                            print(">>> NO notifications queued, watch and global notification URLs were empty.")
-
-                                        # Only prepare to notify if the rules above matched
-                                        if 'notification_urls' in n_object:
-                                            # HTML needs linebreak, but MarkDown and Text can use a linefeed
-                                            if n_object['notification_format'] == 'HTML':
-                                                line_feed_sep = "</br>"
-                                            else:
-                                                line_feed_sep = "\n"
-
-                                            from changedetectionio import diff
-                                            n_object.update({
-                                                'watch_url': watch['url'],
-                                                'uuid': uuid,
-                                                'current_snapshot': str(contents),
-                                                'diff_full': diff.render_diff(prev_fname, fname, line_feed_sep=line_feed_sep),
-                                                'diff': diff.render_diff(prev_fname, fname, True, line_feed_sep=line_feed_sep)
-                                            })
-
-                                            self.notification_q.put(n_object)
-
-                            except Exception as e:
-                                print("!!!! Exception in update_worker !!!\n", e)
-
-                self.current_uuid = None  # Done
-                self.q.task_done()
-
-            self.app.config.exit.wait(1)
+        self.q.task_done(uuid)
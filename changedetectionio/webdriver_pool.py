@@ -0,0 +1,188 @@
+import threading
+import time
+
+from selenium.webdriver.remote.remote_connection import RemoteConnection
+
+
+# Keeps the HTTP connection to the WebDriver server open for all the commands of a session
+# and doesn't wait forever for a WebDriver server that stopped answering (page loads included)
+class KeepAliveRemoteConnection(RemoteConnection):
+    _timeout = 300
+
+    def __init__(self, remote_server_addr):
+        super().__init__(remote_server_addr, keep_alive=True)
+        # Chrome's DevTools commands, what ChromeRemoteConnection adds, used to clear the browser between checks
+        self._commands['executeCdpCommand'] = ('POST', '/session/$sessionId/goog/cdp/execute')
+
+
+class NoSessionAvailable(Exception):
+    pass
+
+
+class PooledSession:
+
+    def __init__(self, driver, command_executor):
+        self.driver = driver
+        self.command_executor = command_executor
+        self.uses = 0
+        self.last_used = time.time()
+
+
+# WebDriver sessions kept open between the checks of html_webdriver watches
+# Starting a browser session is the slowest part of a Chrome/Javascript check, so a few of them are kept warm
+# - At most 'max_sessions' are open at the same time, checks wait for a free one
+# - Between checks the cookies and storage of every site are cleared and the page is set to about:blank,
+#   a session that can't be cleared (no DevTools commands on that WebDriver server) is quit instead
+# - A session is quit after 'max_uses' checks, when something went wrong with it, or when it was not used for
+#   'idle_timeout' seconds (Selenium Grid drops idle sessions itself after 300 seconds by default)
+class WebDriverPool:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.available = threading.Condition(self.lock)
+        self.idle = []
+        # Handed out, and the ones still being started
+        self.busy = []
+        self.in_use = 0
+        self.max_sessions = 2
+        self.created = 0
+        self.reused = 0
+        self.recycled = 0
+
+    def new_driver(self, command_executor):
+        from selenium import webdriver
+        from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
+
+        return webdriver.Remote(
+            command_executor=KeepAliveRemoteConnection(command_executor),
+            desired_capabilities=DesiredCapabilities.CHROME,
+        )
+
+    # max_sessions=None keeps the last one that was set (is_ready() doesn't know the settings)
+    # Raises NoSessionAvailable when no session was free within 'wait_timeout' seconds
+    def acquire(self, command_executor, max_sessions=None, idle_timeout=240, wait_timeout=120):
+        to_quit = []
+        # Set when it gave up waiting
+        in_use = None
+
+        with self.available:
+            if max_sessions:
+                self.max_sessions = max_sessions
+
+            now = time.time()
+            for session in list(self.idle):
+                if now - session.last_used > idle_timeout:
+                    self.idle.remove(session)
+                    to_quit.append(session)
+
+            deadline = time.monotonic() + wait_timeout
+            while True:
+                session = next((s for s in self.idle if s.command_executor == command_executor), None)
+                if session:
+                    self.idle.remove(session)
+                    self.busy.append(session)
+                    self.in_use += 1
+                    self.reused += 1
+                    break
+
+                if self.in_use + len(self.idle) < self.max_sessions:
+                    self.in_use += 1
+                    break
+
+                # Full, but with an idle session for another WebDriver URL, make room
+                if self.idle:
+                    to_quit.append(self.idle.pop(0))
+                    continue
+
+                # Don't wait forever on sessions that were never given back
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.available.wait(remaining):
+                    in_use = self.in_use
+                    break
+
+        self.__quit(to_quit)
+
+        if in_use is not None:
+            raise NoSessionAvailable("No free WebDriver session after {} seconds ({} in use)".format(wait_timeout, in_use))
+
+        if session:
+            return session
+
+        try:
+            session = PooledSession(self.new_driver(command_executor), command_executor)
+        except Exception:
+            with self.available:
+                self.in_use -= 1
+                self.available.notify()
+            raise
+
+        with self.lock:
+            self.busy.append(session)
+            self.created += 1
+
+        return session
+
+    # A session to this WebDriver URL is open, so it's known to work
+    def has_session(self, command_executor):
+        with self.lock:
+            return any(s.command_executor == command_executor for s in self.idle + self.busy)
+
+    # 'discard' when the session had an error, it is quit instead of being used again
+    def release(self, session, max_uses=50, discard=False):
+        session.uses += 1
+        session.last_used = time.time()
+
+        if not discard and session.uses < max_uses:
+            try:
+                self.clear(session.driver)
+            except Exception:
+                discard = True
+        else:
+            discard = True
+
+        if discard:
+            self.__quit([session])
+
+        with self.available:
+            self.busy.remove(session)
+            self.in_use -= 1
+            if discard:
+                self.recycled += 1
+            else:
+                self.idle.append(session)
+            self.available.notify()
+
+    # delete_all_cookies() only deletes the cookies of the current page's domain
+    def clear(self, driver):
+        driver.execute("executeCdpCommand", {'cmd': "Network.clearBrowserCookies", 'params': {}})
+        driver.execute("executeCdpCommand", {'cmd': "Storage.clearDataForOrigin",
+                                             'params': {'origin': "*", 'storageTypes': "all"}})
+        driver.get("about:blank")
+
+    def __quit(self, sessions):
+        for session in sessions:
+            try:
+                session.driver.quit()
+            except Exception:
+                pass
+
+    def close_all(self):
+        with self.lock:
+            sessions = self.idle
+            self.idle = []
+        self.__quit(sessions)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'max': self.max_sessions,
+                'open': self.in_use + len(self.idle),
+                'in_use': self.in_use,
+                'utilisation': round(100 * self.in_use / self.max_sessions, 1) if self.max_sessions else 0,
+                'created': self.created,
+                'reused': self.reused,
+                'recycled': self.recycled,
+            }
+
+
+driver_pool = WebDriverPool()
@@ -0,0 +1,117 @@
+import queue
+import threading
+import time
+from collections import deque
+
+
+# Queue of watch UUIDs to check
+# - A UUID that is already waiting in the queue is not added again
+# - Knows which UUIDs have been handed to a worker and are not finished yet (in flight)
+# Both lookups are O(1), so callers don't need to scan the queue or the worker threads.
+#
+# There are two lanes, so a "Recheck" or an edit from the UI doesn't wait behind a big scheduled sweep
+# - interactive: anything a user asked for, always handed out first
+# - scheduled: watches queued by the ticker because they are due
+# To stop the scheduled lane from starving, one scheduled UUID is handed out after every 'interactive_burst'
+# interactive ones in a row (0 turns that off).
+class UniqueWorkQueue:
+    INTERACTIVE = "interactive"
+    SCHEDULED = "scheduled"
+
+    def __init__(self, interactive_burst=10):
+        self.mutex = threading.Lock()
+        self.not_empty = threading.Condition(self.mutex)
+        self.interactive = deque()
+        self.scheduled = deque()
+        # uuid: lane it is currently waiting in
+        self.queued = {}
+        self.in_flight = set()
+        self.interactive_burst = interactive_burst
+        self.interactive_streak = 0
+        self.closed = False
+
+    # Returns False if the UUID was already waiting in the queue (in the same or a faster lane)
+    def put(self, uuid, interactive=False):
+        lane = self.INTERACTIVE if interactive else self.SCHEDULED
+        with self.mutex:
+            queued_lane = self.queued.get(uuid)
+            if queued_lane == self.INTERACTIVE or queued_lane == lane:
+                return False
+
+            # New, or promoted from the scheduled lane, the old scheduled entry is skipped when it comes up
+            self.queued[uuid] = lane
+            if interactive:
+                self.interactive.append(uuid)
+            else:
+                self.scheduled.append(uuid)
+            self.not_empty.notify()
+
+        return True
+
+    def __pop_scheduled(self):
+        while True:
+            uuid = self.scheduled.popleft()
+            if self.queued.get(uuid) == self.SCHEDULED:
+                return uuid
+
+    def __pop(self):
+        scheduled_waiting = len(self.queued) - len(self.interactive)
+
+        if self.interactive and not (
+                scheduled_waiting and self.interactive_burst and self.interactive_streak >= self.interactive_burst):
+            uuid = self.interactive.popleft()
+            self.interactive_streak += 1
+        else:
+            uuid = self.__pop_scheduled()
+            self.interactive_streak = 0
+
+        del self.queued[uuid]
+        self.in_flight.add(uuid)
+        return uuid
+
+    # Same behaviour as queue.Queue.get(), raises queue.Empty when there is nothing to get
+    # Returns None (the shutdown sentinel) once close() has been called
+    def get(self, block=True, timeout=None):
+        with self.not_empty:
+            if not block:
+                if not self.queued and not self.closed:
+                    raise queue.Empty
+            elif timeout is None:
+                while not self.queued and not self.closed:
+                    self.not_empty.wait()
+            else:
+                endtime = time.monotonic() + timeout
+                while not self.queued and not self.closed:
+                    remaining = endtime - time.monotonic()
+                    if remaining <= 0.0:
+                        raise queue.Empty
+                    self.not_empty.wait(remaining)
+
+            if self.closed:
+                return None
+
+            return self.__pop()
+
+    # Wake up every worker waiting in get() so they can exit
+    def close(self):
+        with self.mutex:
+            self.closed = True
+            self.not_empty.notify_all()
+
+    # The worker is finished with this UUID
+    def task_done(self, uuid):
+        with self.mutex:
+            self.in_flight.discard(uuid)
+
+    def is_in_flight(self, uuid):
+        return uuid in self.in_flight
+
+    # Waiting in the queue or being worked on right now
+    def __contains__(self, uuid):
+        return uuid in self.queued or uuid in self.in_flight
+
+    def qsize(self):
+        return len(self.queued)
+
+    def empty(self):
+        return not self.queued
@@ -0,0 +1,71 @@
+import math
+import threading
+
+
+# The update_worker threads, grown and shrunk at runtime between settings.requests.workers_min and
+# settings.requests.workers (the maximum)
+#
+# The size is worked out from how much work is waiting and how long a fetch takes on average, so a big
+# batch of watches coming due at the same time gets more workers, and they go away again when it's quiet.
+# - Growing starts new threads straight away
+# - Shrinking is done by the workers themselves, a worker that finds the queue empty asks retire() if it
+#   should exit
+class WorkerPool:
+    # Try to have the queue cleared within this many seconds
+    drain_seconds = 30
+    # Weight of the newest fetch time in the running average
+    latency_weight = 0.2
+
+    def __init__(self, q, notification_q, app, datastore, scheduler=None):
+        self.q = q
+        self.notification_q = notification_q
+        self.app = app
+        self.datastore = datastore
+        self.scheduler = scheduler
+        self.lock = threading.Lock()
+        self.workers = []
+        self.target = 0
+        # Running average of the fetch time in seconds, start off by assuming the timeout is hit
+        self.avg_fetch_time = float(datastore.data['settings']['requests']['timeout'])
+
+    def __len__(self):
+        return len(self.workers)
+
+    def bounds(self):
+        settings = self.datastore.data['settings']['requests']
+        # 0 is allowed, when only remote workers should do the checks
+        maximum = max(0, int(settings['workers']))
+        minimum = min(maximum, max(1, int(settings['workers_min'])))
+        return minimum, maximum
+
+    def desired_size(self, queued, in_flight):
+        minimum, maximum = self.bounds()
+        # Every job that is running keeps its worker, plus enough for the queue to be done in drain_seconds
+        wanted = in_flight + math.ceil(queued * self.avg_fetch_time / self.drain_seconds)
+        return min(maximum, max(minimum, wanted))
+
+    def record_fetch_time(self, seconds):
+        with self.lock:
+            self.avg_fetch_time += self.latency_weight * (seconds - self.avg_fetch_time)
+
+    # Called regularly by the ticker and when the settings change
+    def resize(self):
+        from changedetectionio import update_worker
+
+        with self.lock:
+            self.target = self.desired_size(self.q.qsize(), len(self.q.in_flight))
+            while len(self.workers) < self.target:
+                new_worker = update_worker.update_worker(
+                    self.q, self.notification_q, self.app, self.datastore, self.scheduler, pool=self
+                )
+                self.workers.append(new_worker)
+                new_worker.start()
+
+    # Returns True when the worker should exit because there are more workers than needed
+    def retire(self, worker):
+        with self.lock:
+            if len(self.workers) > self.target and worker in self.workers:
+                self.workers.remove(worker)
+                return True
+
+        return False